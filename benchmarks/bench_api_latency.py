@@ -0,0 +1,96 @@
+"""
+Measure /api/status latency while a scan is writing to the database.
+
+Two write loads are compared: "blocking" calls the synchronous Database on the
+event loop (how the scan used to write), "async" goes through AsyncDatabase.
+Results are printed as JSON.
+
+    python benchmarks/bench_api_latency.py --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+async def write_load(mode: str, rows: int):
+    # Same file /api/status reads from, so readers and the writer contend
+    from database import DB_PATH, AsyncDatabase, Database
+
+    db_path = DB_PATH
+
+    if mode == "blocking":
+        db = Database(db_path)
+        for i in range(rows):
+            db.set_media_status(str(i), f"Item {i}", f"/mnt/media/{i}.strm", "ignored")
+            await asyncio.sleep(0)
+    else:
+        db = AsyncDatabase(db_path)
+        for i in range(rows):
+            await db.set_media_status(str(i), f"Item {i}", f"/mnt/media/{i}.strm", "ignored")
+        db.close()
+
+
+async def poll_status(client, done: asyncio.Event, latencies):
+    while not done.is_set():
+        started = time.perf_counter()
+        resp = await client.get("/api/status")
+        resp.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run(mode: str, rows: int):
+    import httpx
+    import main
+
+    latencies = []
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        poller = asyncio.create_task(poll_status(client, done, latencies))
+        started = time.perf_counter()
+        await write_load(mode, rows)
+        elapsed = time.perf_counter() - started
+        done.set()
+        await poller
+    return {
+        "mode": mode,
+        "rows": rows,
+        "write_seconds": round(elapsed, 3),
+        "status_requests": len(latencies),
+        "latency_ms_p50": round(statistics.median(latencies), 2) if latencies else 0.0,
+        "latency_ms_p95": round(percentile(latencies, 95), 2),
+        "latency_ms_max": round(max(latencies), 2) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--mode", choices=["blocking", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    # Keep the benchmark's data/ directory out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="strm_doctor_bench_"))
+    modes = ["blocking", "async"] if args.mode == "both" else [args.mode]
+    results = [asyncio.run(run(mode, args.rows)) for mode in modes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
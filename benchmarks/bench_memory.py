@@ -0,0 +1,89 @@
+"""
+Peak memory of a scan against library size.
+
+Runs bench_scan.py once per library size, each in a fresh process so every
+run reports its own peak RSS, and prints one JSON object with the peaks and
+how much they grew from the smallest library to the largest. By default every
+.strm item is already probed and pages carry full MediaStreams, so the runs
+measure the scan itself: paging, parsing and the checkpoint writes. Peak RSS
+should stay flat as the library grows.
+
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --sizes 10000,50000 --lean --output bench.jsonl
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_scan import git_revision  # noqa: E402
+
+
+def run_scan(items: int, args) -> dict:
+    command = [
+        sys.executable, os.path.join(HERE, "bench_scan.py"),
+        "--items", str(items),
+        "--latency", args.latency,
+        "--probe-delay", "0",
+        "--probed-ratio", str(args.probed_ratio),
+        "--page-size", str(args.page_size),
+        "--page-concurrency", str(args.page_concurrency),
+    ]
+    if not args.lean:
+        command.append("--full-fields")
+    output = subprocess.check_output(command, text=True)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,500000", help="comma-separated items per library")
+    parser.add_argument("--latency", default="0", help="API latency, as for bench_scan.py")
+    parser.add_argument("--probed-ratio", type=float, default=1.0, help="share of .strm items already probed")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--page-concurrency", type=int, default=4)
+    parser.add_argument("--lean", action="store_true", help="lean scan: fetch MediaStreams only for .strm items")
+    parser.add_argument("--output", help="append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    runs = []
+    for items in sorted(int(size) for size in args.sizes.split(",") if size.strip()):
+        scan = run_scan(items, args)
+        runs.append({
+            "items": items,
+            "peak_rss_mb": scan["peak_rss_mb"],
+            "elapsed_seconds": scan["elapsed_seconds"],
+            "scanned": scan["scanned"],
+            "state": scan["state"],
+        })
+        print(f"{items:>9} items: peak RSS {scan['peak_rss_mb']} MB, {scan['elapsed_seconds']}s", file=sys.stderr)
+
+    peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    result = {
+        "benchmark": "memory",
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "revision": git_revision(),
+        "params": {
+            "latency": args.latency,
+            "probed_ratio": args.probed_ratio,
+            "page_size": args.page_size,
+            "page_concurrency": args.page_concurrency,
+            "lean_scan": args.lean,
+        },
+        "runs": runs,
+        "peak_rss_growth_mb": round(peaks[-1] - peaks[0], 1) if len(peaks) > 1 else None,
+        "peak_rss_growth_ratio": round(peaks[-1] / peaks[0], 2) if len(peaks) > 1 and peaks[0] else None,
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
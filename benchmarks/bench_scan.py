@@ -0,0 +1,222 @@
+"""
+End-to-end scan/repair benchmark against the fake Emby server.
+
+Runs `TaskManager._process_library` over an in-process fake Emby (see
+fake_emby.py) with a real SQLite database in a temp directory, then reports
+throughput, time to first probe, peak RSS and time spent in the database as
+one JSON object. `--rescans N` then repeats the forced full scan N times over
+the now stable library, which is what item fingerprints make cheap. With
+`--output` the result is also appended as a line to a JSONL file so runs can
+be compared over time.
+
+    python benchmarks/bench_scan.py --items 5000 --interval 0.001 --in-flight 8
+    python benchmarks/bench_scan.py --latency lognormal:0.02:0.6 --rate-limit-ratio 0.01 --output bench.jsonl
+    python benchmarks/bench_scan.py --items 100000 --latency 0 --probe-delay 0 --rescans 1
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed_database(db_path: str):
+    """AsyncDatabase that accumulates the time its threads spend in sqlite."""
+    from database import AsyncDatabase
+
+    class TimedAsyncDatabase(AsyncDatabase):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.reset_timings()
+
+        def reset_timings(self):
+            self.timings = {"read_seconds": 0.0, "write_seconds": 0.0, "reads": 0, "writes": 0}
+
+        async def _read(self, method: str, *args):
+            def call():
+                started = time.perf_counter()
+                try:
+                    return getattr(self._reader_db(), method)(*args)
+                finally:
+                    self.timings["read_seconds"] += time.perf_counter() - started
+                    self.timings["reads"] += 1
+            return await asyncio.get_running_loop().run_in_executor(self._readers, call)
+
+        async def _write(self, method: str, *args):
+            def call():
+                started = time.perf_counter()
+                try:
+                    return getattr(self._writer_db, method)(*args)
+                finally:
+                    self.timings["write_seconds"] += time.perf_counter() - started
+                    self.timings["writes"] += 1
+            return await asyncio.get_running_loop().run_in_executor(self._writer, call)
+
+    return TimedAsyncDatabase(db_path)
+
+
+async def run(args):
+    import httpx
+    import fake_emby
+    from config import AppConfig, save_config
+    from emby_client import close_all_clients, get_emby_client
+    from task_manager import Job, TaskManager, manager
+
+    config = AppConfig(
+        emby_host="http://fake-emby",
+        api_key="bench",
+        user_id="bench",
+        backend_limits=f"/ {args.interval} {args.in_flight}",
+        probe_workers=args.in_flight,
+        scan_page_size=args.page_size,
+        scan_page_concurrency=args.page_concurrency,
+        lean_scan=not args.full_fields,
+        verify_initial_delay=args.verify_delay,
+        adaptive_rate=not args.no_adaptive,
+        max_consecutive_penalties=args.max_penalties,
+    )
+    save_config(config)
+
+    fake = fake_emby.create_app(fake_emby.options_from_args(args))
+    client = get_emby_client(config)
+    client.transport = httpx.ASGITransport(app=fake)
+
+    # Log lines are only buffered, as with no viewer attached
+    manager.log_buffer.clear()
+    tm = TaskManager()
+    tm.db.close()
+    tm.db = timed_database("data/emby_doctor.db")
+
+    async def scan():
+        job = Job("lib1", force=True)
+        job.state = "running"
+        tm.db.reset_timings()
+        started = time.perf_counter()
+        _, limiter = await tm._acquire_shared()
+        await tm._process_library(job, config, limiter)
+        elapsed = time.perf_counter() - started
+        await tm._release_shared()
+        if job.state == "running":
+            job.state = "stopped" if (job.should_stop or job.rate_limited) else "done"
+        return job, started, elapsed, dict(tm.db.timings)
+
+    job, started, elapsed, timings = await scan()
+    rescans = []
+    for _ in range(args.rescans):
+        rescan_job, _, rescan_elapsed, rescan_timings = await scan()
+        rescans.append({
+            "elapsed_seconds": round(rescan_elapsed, 3),
+            "scanned": rescan_job.stats["scanned"],
+            "probed": rescan_job.stats["processed"],
+            "db": {
+                "read_seconds": round(rescan_timings["read_seconds"], 3),
+                "write_seconds": round(rescan_timings["write_seconds"], 3),
+                "reads": rescan_timings["reads"],
+                "writes": rescan_timings["writes"],
+            },
+        })
+
+    state = fake.state.fake
+    db_stats = await tm.db.get_stats()
+    tm.db.close()
+    await close_all_clients()
+
+    return {
+        "benchmark": "scan",
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "revision": git_revision(),
+        "params": {
+            "items": args.items,
+            "strm_ratio": args.strm_ratio,
+            "probed_ratio": args.probed_ratio,
+            "latency": args.latency,
+            "probe_delay": args.probe_delay,
+            "rate_limit_ratio": args.rate_limit_ratio,
+            "interval": args.interval,
+            "in_flight": args.in_flight,
+            "page_size": args.page_size,
+            "page_concurrency": args.page_concurrency,
+            "lean_scan": not args.full_fields,
+        },
+        "state": job.state,
+        "elapsed_seconds": round(elapsed, 3),
+        "scanned": job.stats["scanned"],
+        "probed": job.stats["processed"],
+        "succeeded": job.stats["success"],
+        "scanned_per_second": round(job.stats["scanned"] / elapsed, 1) if elapsed else None,
+        "probed_per_second": round(job.stats["processed"] / elapsed, 2) if elapsed else None,
+        "time_to_first_probe_seconds": (
+            round(state.first_probe_at - started, 3) if state.first_probe_at is not None else None
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+        "db": {
+            "read_seconds": round(timings["read_seconds"], 3),
+            "write_seconds": round(timings["write_seconds"], 3),
+            "reads": timings["reads"],
+            "writes": timings["writes"],
+            "rows": db_stats,
+        },
+        "server_requests": dict(state.requests),
+        "rescans": rescans,
+    }
+
+
+def main():
+    import fake_emby
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    fake_emby.add_arguments(parser)
+    parser.add_argument("--interval", type=float, default=0.001, help="probe interval per backend, seconds")
+    parser.add_argument("--in-flight", type=int, default=4, help="concurrent probes")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--page-concurrency", type=int, default=4)
+    parser.add_argument("--full-fields", action="store_true", help="request MediaStreams in every page (no lean scan)")
+    parser.add_argument("--verify-delay", type=float, default=0.05)
+    parser.add_argument("--no-adaptive", action="store_true")
+    parser.add_argument("--max-penalties", type=int, default=5)
+    parser.add_argument("--rescans", type=int, default=0, help="forced full scans to time after the first run")
+    parser.add_argument("--output", help="append the result as a JSON line to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Config and database live in a throwaway data/ directory
+    os.chdir(tempfile.mkdtemp(prefix="strm_doctor_bench_"))
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
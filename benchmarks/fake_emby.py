@@ -0,0 +1,249 @@
+"""
+A stand-in Emby server for benchmarks.
+
+Implements just what the task runner calls: user lookup, library views and
+folders, `/Users/{id}/Items` paging (plus `Ids=` lookups), item details and
+`/Items/{id}/PlaybackInfo`. A probed item reports MediaStreams afterwards,
+like a real server once ffprobe has run.
+
+Use it in-process through `httpx.ASGITransport(app=create_app(options))`, or
+run it standalone to point a real instance at it:
+
+    python benchmarks/fake_emby.py --items 5000 --port 8097
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Latency distribution in seconds: `fixed:<s>`, `uniform:<lo>:<hi>` or
+    `lognormal:<median>:<sigma>`. A bare number means fixed.
+    """
+    parts = spec.split(":")
+    kind = parts[0]
+    try:
+        if len(parts) == 1:
+            value = float(kind)
+            return lambda: value
+        args = [float(p) for p in parts[1:]]
+    except ValueError:
+        raise ValueError(f"invalid latency spec: {spec!r}")
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda: random.lognormvariate(mu, args[1])
+    raise ValueError(f"invalid latency spec: {spec!r}")
+
+
+class FakeEmbyOptions:
+    def __init__(
+        self,
+        items: int = 1000,
+        libraries: int = 1,
+        strm_ratio: float = 0.9,
+        probed_ratio: float = 0.1,
+        latency: str = "fixed:0.005",
+        probe_delay: str = "fixed:0.02",
+        rate_limit_ratio: float = 0.0,
+        retry_after: Optional[int] = 1,
+        seed: int = 0,
+    ):
+        self.items = items
+        self.libraries = libraries
+        # Share of items that are .strm files, and of those already probed
+        self.strm_ratio = strm_ratio
+        self.probed_ratio = probed_ratio
+        self.latency = parse_latency(latency)
+        self.probe_delay = parse_latency(probe_delay)
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+
+
+MKV, DONE, STRM = 0, 1, 2
+
+
+def media_streams(index: str):
+    """Streams of a probed item, about as verbose as Emby's: video, two audio tracks, subtitles."""
+    streams = [{
+        "Type": "Video", "Codec": "h264", "Index": 0, "Width": 1920, "Height": 1080, "BitRate": 8_000_000,
+        "AspectRatio": "16:9", "AverageFrameRate": 23.976, "Profile": "High", "Level": 41, "PixelFormat": "yuv420p",
+        "DisplayTitle": "1080p H264", "IsDefault": True, "IsExternal": False,
+    }]
+    for n, language in enumerate(("chi", "eng"), start=1):
+        streams.append({
+            "Type": "Audio", "Codec": "aac", "Index": n, "Language": language, "Channels": 6,
+            "ChannelLayout": "5.1", "SampleRate": 48000, "BitRate": 384_000,
+            "DisplayTitle": f"{language.title()} AAC 5.1", "IsDefault": n == 1, "IsExternal": False,
+        })
+    streams.append({
+        "Type": "Subtitle", "Codec": "subrip", "Index": 3, "Language": "chi", "IsExternal": True,
+        "Path": f"/subs/{index}.chi.srt", "DisplayTitle": "Chi (SRT)", "IsDefault": False,
+    })
+    return streams
+
+
+class FakeEmbyState:
+    """Counters the benchmark reads back after a run."""
+
+    def __init__(self):
+        self.probed = set()
+        self.requests: Dict[str, int] = {"items": 0, "ids": 0, "details": 0, "playback": 0, "throttled": 0}
+        self.first_probe_at: Optional[float] = None
+
+
+def create_app(options: FakeEmbyOptions) -> FastAPI:
+    app = FastAPI()
+    state = app.state.fake = FakeEmbyState()
+    rng = random.Random(options.seed)
+    # Item kind is fixed per index so every page and lookup agrees; one byte
+    # per item keeps the fake itself out of memory benchmarks
+    kinds = bytearray(options.items)
+    for index in range(options.items):
+        roll = rng.random()
+        if roll >= options.strm_ratio:
+            kinds[index] = MKV
+        elif rng.random() < options.probed_ratio:
+            kinds[index] = DONE
+        else:
+            kinds[index] = STRM
+    library_ids = [f"lib{n}" for n in range(1, options.libraries + 1)]
+
+    def make_item(item_id: str, fields: str) -> Optional[Dict]:
+        try:
+            library, index = item_id.rsplit("_", 1)
+            kind = kinds[int(index)]
+        except (ValueError, IndexError):
+            return None
+        backend = ("115", "local", "webdav")[int(index) % 3]
+        item = {
+            "Id": item_id,
+            "Name": f"{library} Item {index}",
+            "Type": "Movie",
+            "Path": f"/mnt/{backend}/{library}/{index}." + ("mkv" if kind == MKV else "strm"),
+            "DateCreated": "2024-01-01T00:00:00.0000000Z",
+            "RunTimeTicks": 72_000_000_000,
+        }
+        if "Etag" in fields:
+            # Changes when the item is re-saved, i.e. once a probe added streams
+            item["Etag"] = f"{index}-{int(item_id in state.probed)}"
+        if "MediaStreams" in fields:
+            has_streams = kind != STRM or item_id in state.probed
+            item["MediaStreams"] = media_streams(index) if has_streams else []
+        return item
+
+    async def delay(dist):
+        seconds = dist()
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    @app.get("/System/Info")
+    async def system_info():
+        return {"ServerName": "fake-emby", "Version": "4.8.0.0"}
+
+    @app.get("/Users/{user_id}")
+    async def user(user_id: str):
+        return {"Name": "bench", "Id": user_id}
+
+    @app.get("/Users/{user_id}/Views")
+    async def views(user_id: str):
+        return {"Items": [{"Id": lib, "Name": lib.upper()} for lib in library_ids]}
+
+    @app.get("/Library/VirtualFolders")
+    async def virtual_folders():
+        return [
+            {
+                "ItemId": lib,
+                "Name": lib.upper(),
+                "Locations": [f"/mnt/{backend}/{lib}" for backend in ("115", "local", "webdav")],
+            }
+            for lib in library_ids
+        ]
+
+    @app.get("/Users/{user_id}/Items")
+    async def items(user_id: str, request: Request):
+        query = request.query_params
+        await delay(options.latency)
+        fields = query.get("Fields", "")
+        if query.get("Ids"):
+            state.requests["ids"] += 1
+            found = [make_item(i, fields) for i in query["Ids"].split(",")]
+            found = [item for item in found if item]
+            return {"Items": found, "TotalRecordCount": len(found)}
+        state.requests["items"] += 1
+        library = query.get("ParentId", library_ids[0])
+        start = int(query.get("StartIndex", 0))
+        limit = int(query.get("Limit", options.items))
+        page = [make_item(f"{library}_{i}", fields) for i in range(start, min(start + limit, options.items))]
+        return {"Items": page, "TotalRecordCount": options.items}
+
+    @app.get("/Users/{user_id}/Items/{item_id}")
+    async def item_details(user_id: str, item_id: str):
+        state.requests["details"] += 1
+        await delay(options.latency)
+        item = make_item(item_id, "Path,MediaStreams")
+        if item is None:
+            return JSONResponse({}, status_code=404)
+        return item
+
+    @app.post("/Items/{item_id}/PlaybackInfo")
+    async def playback_info(item_id: str):
+        state.requests["playback"] += 1
+        if state.first_probe_at is None:
+            state.first_probe_at = time.perf_counter()
+        if options.rate_limit_ratio and rng.random() < options.rate_limit_ratio:
+            state.requests["throttled"] += 1
+            headers = {"Retry-After": str(options.retry_after)} if options.retry_after is not None else {}
+            return JSONResponse({}, status_code=429, headers=headers)
+        await delay(options.probe_delay)
+        state.probed.add(item_id)
+        return {"MediaSources": [{"Id": item_id}]}
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--items", type=int, default=1000, help="items per library")
+    parser.add_argument("--libraries", type=int, default=1)
+    parser.add_argument("--strm-ratio", type=float, default=0.9)
+    parser.add_argument("--probed-ratio", type=float, default=0.1, help="share of .strm items already probed")
+    parser.add_argument("--latency", default="fixed:0.005", help="API latency: fixed:S, uniform:LO:HI, lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--probe-delay", default="fixed:0.02", help="extra PlaybackInfo delay, same syntax")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of probes answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def options_from_args(args) -> FakeEmbyOptions:
+    return FakeEmbyOptions(
+        items=args.items,
+        libraries=args.libraries,
+        strm_ratio=args.strm_ratio,
+        probed_ratio=args.probed_ratio,
+        latency=args.latency,
+        probe_delay=args.probe_delay,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8097)
+    cli_args = parser.parse_args()
+    uvicorn.run(create_app(options_from_args(cli_args)), host="127.0.0.1", port=cli_args.port, log_level="warning")
@@ -0,0 +1,93 @@
+"""
+Sends Emby-style `library.new` notifications to `/api/webhook`.
+
+Item ids follow the fake Emby server's scheme (`<library>_<index>`), so a
+local instance pointed at fake_emby.py can be driven end to end:
+
+    python benchmarks/fake_emby.py --items 5000 --port 8097
+    python benchmarks/fake_webhook.py --url http://127.0.0.1:5000/api/webhook --count 50 --interval 0.05
+
+`--form` posts the payload as the `data` field of a multipart form, like
+older Emby webhook plugins; `--batch` sends one `{"ItemIds": [...]}` call.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+import httpx
+
+
+def notification(item_id: str, library: str, index: int) -> dict:
+    return {
+        "Title": f"New item {item_id}",
+        "Event": "library.new",
+        "Date": time.strftime("%Y-%m-%dT%H:%M:%S.0000000Z", time.gmtime()),
+        "Item": {
+            "Id": item_id,
+            "Name": f"{library} Item {index}",
+            "Path": f"/mnt/{('115', 'local', 'webdav')[index % 3]}/{library}/{index}.strm",
+            "Type": "Movie",
+        },
+        "Server": {"Name": "fake-emby"},
+    }
+
+
+async def send_notifications(
+    client: httpx.AsyncClient,
+    url: str,
+    library: str,
+    indexes: List[int],
+    token: Optional[str] = None,
+    form: bool = False,
+    batch: bool = False,
+    interval: float = 0.0,
+) -> List[dict]:
+    """Post one notification per index (or one batch); returns the responses."""
+    params = {"token": token} if token else None
+    if batch:
+        ids = [f"{library}_{i}" for i in indexes]
+        resp = await client.post(url, params=params, json={"ItemIds": ids})
+        resp.raise_for_status()
+        return [resp.json()]
+    results = []
+    for i in indexes:
+        payload = notification(f"{library}_{i}", library, i)
+        if form:
+            resp = await client.post(url, params=params, files={"data": (None, json.dumps(payload))})
+        else:
+            resp = await client.post(url, params=params, json=payload)
+        resp.raise_for_status()
+        results.append(resp.json())
+        if interval > 0:
+            await asyncio.sleep(interval)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/webhook")
+    parser.add_argument("--token")
+    parser.add_argument("--library", default="lib1")
+    parser.add_argument("--start", type=int, default=0, help="first item index")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1, help="send every notification this many times")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between notifications")
+    parser.add_argument("--form", action="store_true", help="multipart form with a `data` field")
+    parser.add_argument("--batch", action="store_true", help='one {"ItemIds": [...]} call')
+    args = parser.parse_args()
+
+    async def run():
+        indexes = list(range(args.start, args.start + args.count)) * max(args.repeat, 1)
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            results = await send_notifications(
+                client, args.url, args.library, indexes, args.token, args.form, args.batch, args.interval
+            )
+        print(json.dumps({"sent": len(results), "queued": sum(r.get("queued", 0) for r in results)}))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
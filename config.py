@@ -1,7 +1,11 @@
+import asyncio
 import json
+import logging
 import os
 from pydantic import BaseModel
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "data/config.json"
 
@@ -12,6 +16,58 @@ class AppConfig(BaseModel):
     scan_interval: int = 5
     batch_size: int = 0  # 0 means unlimited
     exclude_paths: str = ""
+    include_paths: str = ""  # if set, only matching paths are processed
+    # Probe worker pool: total concurrency, plus per path-prefix pacing lines
+    # "<prefix> <interval_seconds> [max_in_flight]"; other paths use
+    # scan_interval with up to probe_workers probes in flight
+    probe_workers: int = 4
+    backend_limits: str = ""
+    # Probe order ("newest", "favorites", "recent", "retries", most significant
+    # first; "none" keeps scan order) and items each backend takes from the
+    # queue at a time
+    probe_priority: str = "newest"
+    probe_prefetch: int = 8
+    # Deadline for one probe request; a probe cut off by it is recorded as
+    # "timeout" and retried later instead of counting as a failure
+    probe_timeout: float = 120.0
+    # Library enumeration: page size, pages fetched in parallel, and whether
+    # to request MediaStreams only for .strm items
+    scan_page_size: int = 500
+    scan_page_concurrency: int = 4
+    lean_scan: bool = True
+    # Post-probe verification: first check after this delay, then exponential
+    # backoff until MediaStreams show up or the timeout passes
+    verify_initial_delay: float = 1.0
+    verify_timeout: float = 30.0
+    # Adaptive (AIMD) pacing on top of the per-backend intervals
+    adaptive_rate: bool = True
+    # Never probe faster than interval / speedup; the default 1.0 only lets
+    # AIMD slow down below the configured interval, never speed past it
+    aimd_max_speedup: float = 1.0
+    aimd_decrease_factor: float = 0.5
+    max_consecutive_penalties: int = 5  # consecutive 429/403 before aborting
+    # Job scheduler: libraries scanned at once, WRR weights for the shared
+    # probe budget ("<library_id> <weight>" lines) and cron schedules
+    # ("<min> <hour> <dom> <month> <dow> <library_id|all> [force]" lines)
+    max_concurrent_jobs: int = 2
+    library_weights: str = ""
+    schedules: str = ""
+    # HTTP connection pool for the Emby API
+    http_max_connections: int = 20
+    http_max_keepalive: int = 10
+    http_keepalive_expiry: float = 30.0
+    http2: bool = False  # requires the optional "h2" package
+    # Optional local pre-check of .strm targets before probing through Emby.
+    # strm_path_map lines "<emby_prefix> <local_prefix>" translate Emby paths
+    # to where the files are mounted in this container.
+    strm_precheck: bool = False
+    strm_path_map: str = ""
+    strm_check_per_host: int = 4
+    strm_check_timeout: float = 10.0
+    # Emby webhook intake (/api/webhook?token=...): new items are looked up
+    # and probed once no new notification arrived for webhook_debounce seconds
+    webhook_token: str = ""
+    webhook_debounce: float = 5.0
 
     class Config:
         json_schema_extra = {
@@ -21,22 +77,108 @@ class AppConfig(BaseModel):
                 "user_id": "your_user_id",
                 "scan_interval": 5,
                 "batch_size": 0,
-                "exclude_paths": "/mnt/user/115/\n/mnt/user/aliyun/"
+                "exclude_paths": "/mnt/user/115/\n/mnt/user/aliyun/",
+                "include_paths": "",
+                "probe_workers": 4,
+                "backend_limits": "/mnt/user/115/ 5 1\n/mnt/user/local/ 0.5 4",
+                "probe_priority": "favorites newest",
+                "probe_prefetch": 8,
+                "probe_timeout": 120.0,
+                "scan_page_size": 500,
+                "scan_page_concurrency": 4,
+                "lean_scan": True,
+                "verify_initial_delay": 1.0,
+                "verify_timeout": 30.0,
+                "adaptive_rate": True,
+                "aimd_max_speedup": 1.0,
+                "aimd_decrease_factor": 0.5,
+                "max_consecutive_penalties": 5,
+                "max_concurrent_jobs": 2,
+                "library_weights": "",
+                "schedules": "30 3 * * * all",
+                "http_max_connections": 20,
+                "http_max_keepalive": 10,
+                "http_keepalive_expiry": 30.0,
+                "http2": False,
+                "strm_precheck": False,
+                "strm_path_map": "/mnt/user/media/ /media/",
+                "strm_check_per_host": 4,
+                "strm_check_timeout": 10.0,
+                "webhook_token": "change-me",
+                "webhook_debounce": 5.0
             }
         }
 
+# Parsed config shared by every caller, re-read only when the file changes
+# (mtime/size) or through save_config. Treat the returned object as read-only.
+_cache: Optional[AppConfig] = None
+_cache_stamp: Optional[Tuple[int, int]] = None
+_subscribers: List[Callable[[AppConfig], None]] = []
+
+
+def _file_stamp() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def subscribe(callback: Callable[[AppConfig], None]):
+    """Call `callback(config)` whenever the effective configuration changes."""
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[AppConfig], None]):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def _publish(config: AppConfig):
+    global _cache
+    previous, _cache = _cache, config
+    if previous is None or previous == config:
+        return
+    for callback in list(_subscribers):
+        try:
+            callback(config)
+        except Exception:
+            logger.exception("应用配置变更失败")
+
+
 def load_config() -> AppConfig:
-    if not os.path.exists(CONFIG_FILE):
-        return AppConfig()
+    global _cache_stamp
+    stamp = _file_stamp()
+    if _cache is not None and stamp == _cache_stamp:
+        return _cache
+    _cache_stamp = stamp
+    if stamp is None:
+        _publish(AppConfig())
+        return _cache
     try:
         with open(CONFIG_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-            return AppConfig(**data)
+        config = AppConfig(**data)
     except Exception as e:
-        print(f"Error loading config: {e}")
-        return AppConfig()
+        logger.error(f"加载配置失败，继续使用上一次的有效配置: {e}")
+        # A half-written or broken edit keeps the last good config in effect
+        if _cache is None:
+            _publish(AppConfig())
+        return _cache
+    _publish(config)
+    return _cache
 
 def save_config(config: AppConfig):
+    global _cache_stamp
     os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
     with open(CONFIG_FILE, "w", encoding="utf-8") as f:
         f.write(config.model_dump_json(indent=4))
+    _cache_stamp = _file_stamp()
+    _publish(config)
+
+
+async def watch_config(interval: float = 5.0):
+    """Background loop: pick up edits made to the config file by hand."""
+    while True:
+        await asyncio.sleep(interval)
+        load_config()
@@ -1,17 +1,46 @@
 import os
+import random
 import sqlite3
+import asyncio
 import datetime
-from typing import Optional, List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Iterable, Tuple
 
 DB_PATH = "data/emby_doctor.db"
 
+# Failed probes are retried with exponential backoff: the n-th failure waits
+# RETRY_BASE_DELAY * 2^(n-1) seconds (±50% jitter, doubling capped at 2^10),
+# and an item is given up on after MAX_RETRIES failures unless forced.
+RETRY_BASE_DELAY = 1800.0
+RETRY_JITTER = 0.5
+MAX_RETRIES = 5
+# Probes cut off by their deadline are "timeout", not failures: they are due
+# again after TIMEOUT_RETRY_DELAY (same jitter and doubling by earlier
+# failures) and do not count towards MAX_RETRIES.
+TIMEOUT_RETRY_DELAY = 600.0
+
+# Current time as unix epoch seconds, in SQL; constant within one statement
+SQL_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
 class Database:
     def __init__(self, db_path: str = DB_PATH):
-        os.makedirs("data", exist_ok=True)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._init_pragmas()
         self._init_schema()
 
+    def _init_pragmas(self):
+        # WAL lets readers run alongside the scan's writes; NORMAL sync only
+        # fsyncs at checkpoints, which is safe in WAL mode.
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA cache_size=-20000")
+        cur.execute("PRAGMA temp_store=MEMORY")
+
     def _init_schema(self):
         cur = self.conn.cursor()
         cur.execute(
@@ -22,15 +51,121 @@ class Database:
             "status TEXT,"
             "retry_count INTEGER DEFAULT 0,"
             "last_update TIMESTAMP,"
-            "meta_info TEXT)"
+            "meta_info TEXT,"
+            "library_id TEXT)"
         )
         cur.execute(
             "CREATE TABLE IF NOT EXISTS system_config ("
             "key TEXT PRIMARY KEY,"
             "value TEXT)"
         )
+        # Run checkpoints: one row per interrupted/in-progress library run,
+        # plus the items it has queued but not finished yet. run_pending is
+        # also the run's probe queue: workers claim rows in priority order.
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS run_checkpoint ("
+            "library_id TEXT PRIMARY KEY,"
+            "full_mode INTEGER,"
+            "since TEXT,"
+            "started_at TEXT,"
+            "cursor INTEGER DEFAULT 0,"
+            "state TEXT,"
+            "updated_at TIMESTAMP)"
+        )
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS run_pending ("
+            "library_id TEXT NOT NULL,"
+            "emby_id TEXT NOT NULL,"
+            "name TEXT,"
+            "path TEXT,"
+            "backend TEXT,"
+            "priority TEXT DEFAULT '',"
+            "seq INTEGER DEFAULT 0,"
+            "claimed INTEGER DEFAULT 0,"
+            "PRIMARY KEY (library_id, emby_id)) WITHOUT ROWID"
+        )
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS seen_ids ("
+            "library_id TEXT NOT NULL,"
+            "emby_id TEXT NOT NULL,"
+            "PRIMARY KEY (library_id, emby_id)) WITHOUT ROWID"
+        )
+        self._add_missing_columns(
+            cur, "media_status", {"library_id": "TEXT", "next_retry_at": "REAL", "fingerprint": "INTEGER"}
+        )
+        self._add_missing_columns(cur, "run_pending", {
+            "name": "TEXT", "path": "TEXT", "backend": "TEXT",
+            "priority": "TEXT DEFAULT ''", "seq": "INTEGER DEFAULT 0", "claimed": "INTEGER DEFAULT 0",
+        })
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_run_pending_queue "
+            "ON run_pending(library_id, backend, claimed, priority, seq)"
+        )
+        # The retry pass walks a library's failed and timed out rows in due order
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_media_status_due "
+            "ON media_status(library_id, next_retry_at, emby_id) WHERE status IN ('failed', 'timeout')"
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_media_status_library ON media_status(library_id)")
+        # Browsing pages by (last_update, emby_id), optionally within one status
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_media_status_status ON media_status(status, last_update, emby_id)"
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_media_status_update ON media_status(last_update, emby_id)")
+        self._init_status_counts(cur)
         self.conn.commit()
 
+    def _init_status_counts(self, cur):
+        """
+        Per-status row counts kept current by triggers, so every write path
+        (upserts, batches, reconciliation deletes) updates them in the same
+        transaction and get_stats never has to count.
+        """
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'status_counts'")
+        exists = cur.fetchone() is not None
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS status_counts ("
+            "status TEXT PRIMARY KEY,"
+            "count INTEGER NOT NULL DEFAULT 0)"
+        )
+        cur.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_status_count_insert AFTER INSERT ON media_status BEGIN "
+            "INSERT INTO status_counts (status, count) VALUES (NEW.status, 1) "
+            "ON CONFLICT(status) DO UPDATE SET count = count + 1; "
+            "END"
+        )
+        cur.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_status_count_delete AFTER DELETE ON media_status BEGIN "
+            "UPDATE status_counts SET count = count - 1 WHERE status = OLD.status; "
+            "END"
+        )
+        cur.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_status_count_update AFTER UPDATE OF status ON media_status "
+            "WHEN OLD.status IS NOT NEW.status BEGIN "
+            "UPDATE status_counts SET count = count - 1 WHERE status = OLD.status; "
+            "INSERT INTO status_counts (status, count) VALUES (NEW.status, 1) "
+            "ON CONFLICT(status) DO UPDATE SET count = count + 1; "
+            "END"
+        )
+        if not exists:
+            # Existing database from an older version: count once
+            self._rebuild_status_counts(cur)
+
+    def _rebuild_status_counts(self, cur):
+        cur.execute("DELETE FROM status_counts")
+        cur.execute(
+            "INSERT INTO status_counts (status, count) "
+            "SELECT status, COUNT(*) FROM media_status WHERE status IS NOT NULL GROUP BY status"
+        )
+
+    def _add_missing_columns(self, cur, table: str, columns: Dict[str, str]):
+        """Upgrade databases created by older versions in place."""
+        cur.execute(f"PRAGMA table_info({table})")
+        existing = {row["name"] for row in cur.fetchall()}
+        for name, decl in columns.items():
+            if name not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
     def get_media_status(self, emby_id: str) -> Optional[Dict]:
         cur = self.conn.cursor()
         cur.execute("SELECT * FROM media_status WHERE emby_id = ?", (emby_id,))
@@ -39,6 +174,72 @@ class Database:
             return None
         return {k: row[k] for k in row.keys()}
 
+    def get_media_statuses(self, emby_ids: List[str]) -> Dict[str, Dict]:
+        """Status, retry_count, next_retry_at and fingerprint for many ids at once, keyed by emby_id."""
+        result = {}
+        cur = self.conn.cursor()
+        batch_size = 900
+        for i in range(0, len(emby_ids), batch_size):
+            chunk = emby_ids[i : i + batch_size]
+            placeholders = ",".join(["?"] * len(chunk))
+            cur.execute(
+                "SELECT emby_id, status, retry_count, next_retry_at, fingerprint "
+                f"FROM media_status WHERE emby_id IN ({placeholders})",
+                chunk,
+            )
+            for row in cur.fetchall():
+                result[row["emby_id"]] = {
+                    "status": row["status"],
+                    "retry_count": row["retry_count"],
+                    "next_retry_at": row["next_retry_at"],
+                    "fingerprint": row["fingerprint"],
+                }
+        return result
+
+    # retry_count and next_retry_at are computed in SQL so an upsert never
+    # needs a prior SELECT. The delay parameter is the jittered base delay of
+    # a failure or timeout (NULL otherwise); a new row waits that long, an existing one
+    # waits it times 2^(failures - 1). A success resets the failure count, so
+    # a later failure backs off from the start. The fingerprint of the item as scanned
+    # is only kept with "ignored" rows; any other status clears it.
+    UPSERT_MEDIA_STATUS = (
+        "INSERT INTO media_status "
+        "(emby_id, name, path, status, retry_count, last_update, meta_info, library_id, next_retry_at, fingerprint) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, {SQL_NOW} + ?, ?) "
+        "ON CONFLICT(emby_id) DO UPDATE SET "
+        "name=excluded.name, path=excluded.path, status=excluded.status, fingerprint=excluded.fingerprint, "
+        "retry_count=CASE WHEN excluded.status = 'success' THEN 0 "
+        "ELSE media_status.retry_count + excluded.retry_count END, "
+        "last_update=excluded.last_update, meta_info=excluded.meta_info, "
+        "library_id=COALESCE(excluded.library_id, media_status.library_id), "
+        f"next_retry_at={SQL_NOW} + (excluded.next_retry_at - {SQL_NOW}) "
+        "* (1 << MAX(MIN(media_status.retry_count + excluded.retry_count, 11) - 1, 0))"
+    )
+
+    @staticmethod
+    def _status_row(
+        emby_id: str,
+        name: str,
+        path: str,
+        status: str,
+        meta_info: Optional[str] = None,
+        increment_retry: bool = False,
+        library_id: Optional[str] = None,
+        fingerprint: Optional[int] = None,
+    ) -> Tuple:
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        retry_delay = None
+        if status == "failed" and increment_retry:
+            retry_delay = RETRY_BASE_DELAY * random.uniform(1 - RETRY_JITTER, 1 + RETRY_JITTER)
+        elif status == "timeout":
+            retry_delay = TIMEOUT_RETRY_DELAY * random.uniform(1 - RETRY_JITTER, 1 + RETRY_JITTER)
+        if status != "ignored":
+            fingerprint = None
+        return (
+            emby_id, name, path, status, 1 if increment_retry else 0, now, meta_info, library_id, retry_delay,
+            fingerprint,
+        )
+
     def set_media_status(
         self,
         emby_id: str,
@@ -47,51 +248,248 @@ class Database:
         status: str,
         meta_info: Optional[str] = None,
         increment_retry: bool = False,
+        library_id: Optional[str] = None,
     ):
-        now = datetime.datetime.utcnow().isoformat() + "Z"
-        existing = self.get_media_status(emby_id)
-        retry = 0
-        if existing:
-            retry = int(existing.get("retry_count") or 0)
-        if increment_retry:
-            retry += 1
+        row = self._status_row(emby_id, name, path, status, meta_info, increment_retry, library_id)
+        with self.conn:
+            self.conn.execute(self.UPSERT_MEDIA_STATUS, row)
+
+    def set_media_status_many(self, rows: Iterable[Tuple]):
+        """Upsert many rows built by `_status_row` in a single transaction."""
+        with self.conn:
+            self.conn.executemany(self.UPSERT_MEDIA_STATUS, rows)
+
+    def get_due_retries(
+        self,
+        library_id: str,
+        now: float,
+        after: Optional[Tuple[float, str]] = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """
+        Failed or timed out items of `library_id` whose retry time has
+        passed, in due order, leaving out items the current run has already
+        queued.
+        `after` is the (next_retry_at, emby_id) of the previous page.
+        """
+        params: List = [now, MAX_RETRIES, library_id, library_id]
+        keyset = ""
+        if after is not None:
+            keyset = "AND (next_retry_at, emby_id) > (?, ?) "
+            params.extend(after)
         cur = self.conn.cursor()
         cur.execute(
-            "INSERT INTO media_status (emby_id, name, path, status, retry_count, last_update, meta_info) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?) "
-            "ON CONFLICT(emby_id) DO UPDATE SET "
-            "name=excluded.name, path=excluded.path, status=excluded.status, "
-            "retry_count=excluded.retry_count, last_update=excluded.last_update, meta_info=excluded.meta_info",
-            (emby_id, name, path, status, retry, now, meta_info),
+            "SELECT emby_id, next_retry_at FROM media_status "
+            "WHERE status IN ('failed', 'timeout') AND next_retry_at <= ? AND retry_count < ? AND library_id = ? "
+            "AND emby_id NOT IN (SELECT emby_id FROM run_pending WHERE library_id = ?) "
+            f"{keyset}ORDER BY next_retry_at, emby_id LIMIT ?",
+            params + [limit],
         )
-        self.conn.commit()
+        return [dict(row) for row in cur.fetchall()]
 
-    def get_all_ids(self) -> List[str]:
+    # Reconciliation of deleted items. Ids seen during a full scan are staged
+    # in the seen_ids table, then diffed against the library in SQL, so memory
+    # does not grow with the catalogue. The staging survives a restart, so a
+    # resumed full scan still knows what the first part of it saw.
+    def begin_seen_ids(self, library_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM seen_ids WHERE library_id = ?", (library_id,))
+
+    def add_seen_ids(self, library_id: str, emby_ids: List[str]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_ids (library_id, emby_id) VALUES (?, ?)",
+                [(library_id, emby_id) for emby_id in emby_ids],
+            )
+
+    def delete_unseen_ids(self, library_id: str) -> int:
+        """
+        Delete rows of `library_id` that were not seen by the scan. Rows from
+        older versions without a library are claimed first if they were seen.
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE media_status SET library_id = ? WHERE library_id IS NULL "
+                "AND emby_id IN (SELECT emby_id FROM seen_ids WHERE library_id = ?)",
+                (library_id, library_id),
+            )
+            cur = self.conn.execute(
+                "DELETE FROM media_status WHERE library_id = ? "
+                "AND emby_id NOT IN (SELECT emby_id FROM seen_ids WHERE library_id = ?)",
+                (library_id, library_id),
+            )
+            removed = cur.rowcount
+            self.conn.execute("DELETE FROM seen_ids WHERE library_id = ?", (library_id,))
+        return removed
+
+    # Run checkpoints. A page's queued ids and the cursor past it are written
+    # in one transaction, so a resumed run neither skips nor repeats a page.
+    def get_checkpoint(self, library_id: str) -> Optional[Dict]:
         cur = self.conn.cursor()
-        cur.execute("SELECT emby_id FROM media_status")
+        cur.execute("SELECT * FROM run_checkpoint WHERE library_id = ?", (library_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    def get_checkpoints(self, state: Optional[str] = None) -> List[Dict]:
+        cur = self.conn.cursor()
+        if state is None:
+            cur.execute("SELECT * FROM run_checkpoint")
+        else:
+            cur.execute("SELECT * FROM run_checkpoint WHERE state = ?", (state,))
+        return [dict(row) for row in cur.fetchall()]
+
+    def begin_checkpoint(self, library_id: str, full_mode: bool, since: Optional[str], started_at: str):
+        """Start a fresh checkpoint, dropping whatever a previous run left behind."""
+        with self.conn:
+            self.conn.execute("DELETE FROM run_pending WHERE library_id = ?", (library_id,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO run_checkpoint "
+                "(library_id, full_mode, since, started_at, cursor, state, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, 'running', ?)",
+                (library_id, int(full_mode), since, started_at, datetime.datetime.now()),
+            )
+
+    def set_checkpoint_state(self, library_id: str, state: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE run_checkpoint SET state = ?, updated_at = ? WHERE library_id = ?",
+                (state, datetime.datetime.now(), library_id),
+            )
+
+    def checkpoint_page(
+        self, library_id: str, cursor: Optional[int], rows: List[Tuple], requeue: bool = False
+    ) -> Dict[str, int]:
+        """
+        Queue a page's candidates, as (emby_id, name, path, backend, priority,
+        seq, claimed) rows, and move the cursor past the page (unless None).
+        Ids already queued in this run are left alone, unless `requeue` (a
+        resumed run re-queueing its held rows). Returns the unclaimed rows
+        added per backend.
+        """
+        verb = "INSERT OR REPLACE" if requeue else "INSERT OR IGNORE"
+        added: Dict[str, int] = {}
+        with self.conn:
+            for row in rows:
+                cur = self.conn.execute(
+                    f"{verb} INTO run_pending "
+                    "(library_id, emby_id, name, path, backend, priority, seq, claimed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (library_id,) + tuple(row),
+                )
+                if cur.rowcount > 0 and not row[6]:
+                    added[row[3]] = added.get(row[3], 0) + 1
+            if cursor is not None:
+                self.conn.execute(
+                    "UPDATE run_checkpoint SET cursor = ?, updated_at = ? WHERE library_id = ?",
+                    (cursor, datetime.datetime.now(), library_id),
+                )
+        return added
+
+    def remove_pending(self, library_id: str, emby_ids: List[str]):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM run_pending WHERE library_id = ? AND emby_id = ?",
+                [(library_id, emby_id) for emby_id in emby_ids],
+            )
+
+    def hold_pending(self, library_id: str):
+        """Mark all queued rows claimed, until a resumed run re-queues them."""
+        with self.conn:
+            self.conn.execute("UPDATE run_pending SET claimed = 1 WHERE library_id = ?", (library_id,))
+
+    def claim_pending(self, library_id: str, backend: str, limit: int) -> List[Dict]:
+        """Hand out the best `limit` unclaimed rows of one backend's queue."""
+        with self.conn:
+            cur = self.conn.execute(
+                "SELECT emby_id, name, path, priority, seq FROM run_pending "
+                "WHERE library_id = ? AND backend = ? AND claimed = 0 "
+                "ORDER BY priority, seq LIMIT ?",
+                (library_id, backend, limit),
+            )
+            rows = [dict(row) for row in cur.fetchall()]
+            self.conn.executemany(
+                "UPDATE run_pending SET claimed = 1 WHERE library_id = ? AND emby_id = ?",
+                [(library_id, row["emby_id"]) for row in rows],
+            )
+        return rows
+
+    def get_pending(self, library_id: str, after: Optional[str] = None, limit: int = 100) -> List[str]:
+        """One page of a run's queued ids in id order; `after` is the last id of the previous page."""
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT emby_id FROM run_pending WHERE library_id = ? AND emby_id > ? ORDER BY emby_id LIMIT ?",
+            (library_id, after or "", limit),
+        )
         return [row[0] for row in cur.fetchall()]
 
-    def delete_ids(self, ids: List[str]) -> int:
-        if not ids:
-            return 0
+    def count_pending(self, library_id: str) -> int:
         cur = self.conn.cursor()
-        total = 0
-        batch_size = 900
-        for i in range(0, len(ids), batch_size):
-            chunk = ids[i : i + batch_size]
-            placeholders = ",".join(["?"] * len(chunk))
-            cur.execute(f"DELETE FROM media_status WHERE emby_id IN ({placeholders})", chunk)
-            total += cur.rowcount
-        self.conn.commit()
-        return total
+        cur.execute("SELECT COUNT(*) FROM run_pending WHERE library_id = ?", (library_id,))
+        return cur.fetchone()[0]
+
+    def finish_checkpoint(self, library_id: str, watermark: Optional[str] = None):
+        """Drop a completed run's checkpoint and advance the library's watermark."""
+        with self.conn:
+            self.conn.execute("DELETE FROM run_pending WHERE library_id = ?", (library_id,))
+            self.conn.execute("DELETE FROM run_checkpoint WHERE library_id = ?", (library_id,))
+            if watermark:
+                self.conn.execute(
+                    "INSERT INTO system_config (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                    (f"last_sync_time:{library_id}", watermark),
+                )
 
     def get_stats(self) -> Dict[str, int]:
+        stats = {"success": 0, "failed": 0}
         cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM media_status WHERE status = 'success'")
-        success = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM media_status WHERE status = 'failed'")
-        failed = cur.fetchone()[0]
-        return {"success": success, "failed": failed}
+        cur.execute("SELECT status, count FROM status_counts")
+        for row in cur.fetchall():
+            stats[row["status"]] = row["count"]
+        return stats
+
+    BROWSE_COLUMNS = "emby_id, name, path, status, retry_count, last_update, meta_info, library_id"
+
+    def browse_media_status(
+        self,
+        status: Optional[str] = None,
+        library_id: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of rows, most recently updated first. Paging is keyset based:
+        `cursor` is the `last_update|emby_id` of the previous page's last row,
+        so every page is an index range scan however deep it is.
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        """
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if library_id:
+            clauses.append("library_id = ?")
+            params.append(library_id)
+        if path_prefix:
+            clauses.append("path >= ? AND path < ?")
+            params.extend([path_prefix, path_prefix + "\uffff"])
+        if cursor:
+            last_update, _, emby_id = cursor.partition("|")
+            clauses.append("(last_update, emby_id) < (?, ?)")
+            params.extend([last_update, emby_id])
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT {self.BROWSE_COLUMNS} FROM media_status {where}"
+            "ORDER BY last_update DESC, emby_id DESC LIMIT ?",
+            params + [limit + 1],
+        )
+        rows = [dict(row) for row in cur.fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['last_update']}|{rows[-1]['emby_id']}"
+        return rows, next_cursor
 
     def get_config(self, key: str) -> Optional[str]:
         cur = self.conn.cursor()
@@ -107,3 +505,198 @@ class Database:
             (key, value),
         )
         self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class AsyncDatabase:
+    """
+    Async facade over `Database` that keeps sqlite off the event loop.
+
+    All writes go through one dedicated writer thread (the executor's queue
+    serialises them on a single connection); reads run on a small thread
+    pool where every thread owns its own connection, so with WAL they never
+    wait for a scan that is writing.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, readers: int = 2):
+        self.db_path = db_path
+        self._writer_db = Database(db_path)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_count = readers
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+
+    def _reader_db(self) -> Database:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = Database(self.db_path)
+        return db
+
+    async def _read(self, method: str, *args):
+        def call():
+            return getattr(self._reader_db(), method)(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._readers, call)
+
+    async def _write(self, method: str, *args):
+        call = getattr(self._writer_db, method)
+        return await asyncio.get_running_loop().run_in_executor(self._writer, call, *args)
+
+    async def get_media_status(self, emby_id: str) -> Optional[Dict]:
+        return await self._read("get_media_status", emby_id)
+
+    async def get_media_statuses(self, emby_ids: List[str]) -> Dict[str, Dict]:
+        return await self._read("get_media_statuses", emby_ids)
+
+    async def get_due_retries(
+        self,
+        library_id: str,
+        now: float,
+        after: Optional[Tuple[float, str]] = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        return await self._read("get_due_retries", library_id, now, after, limit)
+
+    async def get_stats(self) -> Dict[str, int]:
+        return await self._read("get_stats")
+
+    async def get_config(self, key: str) -> Optional[str]:
+        return await self._read("get_config", key)
+
+    async def browse_media_status(
+        self,
+        status: Optional[str] = None,
+        library_id: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        return await self._read("browse_media_status", status, library_id, path_prefix, limit, cursor)
+
+    async def set_media_status(
+        self,
+        emby_id: str,
+        name: str,
+        path: str,
+        status: str,
+        meta_info: Optional[str] = None,
+        increment_retry: bool = False,
+        library_id: Optional[str] = None,
+    ):
+        await self._write("set_media_status", emby_id, name, path, status, meta_info, increment_retry, library_id)
+
+    async def set_media_status_many(self, rows: List[Tuple]):
+        await self._write("set_media_status_many", rows)
+
+    async def set_config(self, key: str, value: str):
+        await self._write("set_config", key, value)
+
+    async def get_checkpoint(self, library_id: str) -> Optional[Dict]:
+        return await self._read("get_checkpoint", library_id)
+
+    async def get_checkpoints(self, state: Optional[str] = None) -> List[Dict]:
+        return await self._read("get_checkpoints", state)
+
+    async def get_pending(self, library_id: str, after: Optional[str] = None, limit: int = 100) -> List[str]:
+        return await self._read("get_pending", library_id, after, limit)
+
+    async def count_pending(self, library_id: str) -> int:
+        return await self._read("count_pending", library_id)
+
+    async def begin_checkpoint(self, library_id: str, full_mode: bool, since: Optional[str], started_at: str):
+        await self._write("begin_checkpoint", library_id, full_mode, since, started_at)
+
+    async def set_checkpoint_state(self, library_id: str, state: str):
+        await self._write("set_checkpoint_state", library_id, state)
+
+    async def checkpoint_page(
+        self, library_id: str, cursor: Optional[int], rows: List[Tuple], requeue: bool = False
+    ) -> Dict[str, int]:
+        return await self._write("checkpoint_page", library_id, cursor, rows, requeue)
+
+    async def hold_pending(self, library_id: str):
+        await self._write("hold_pending", library_id)
+
+    async def claim_pending(self, library_id: str, backend: str, limit: int) -> List[Dict]:
+        return await self._write("claim_pending", library_id, backend, limit)
+
+    async def remove_pending(self, library_id: str, emby_ids: List[str]):
+        await self._write("remove_pending", library_id, emby_ids)
+
+    async def finish_checkpoint(self, library_id: str, watermark: Optional[str] = None):
+        await self._write("finish_checkpoint", library_id, watermark)
+
+    async def begin_seen_ids(self, library_id: str):
+        await self._write("begin_seen_ids", library_id)
+
+    async def add_seen_ids(self, library_id: str, emby_ids: List[str]):
+        await self._write("add_seen_ids", library_id, emby_ids)
+
+    async def delete_unseen_ids(self, library_id: str) -> int:
+        return await self._write("delete_unseen_ids", library_id)
+
+    def close(self):
+        """
+        Close every connection on the thread that owns it, then stop the
+        threads. The writer goes last: closing the last connection
+        checkpoints the WAL and removes it.
+        """
+        # One task per reader thread: each waits at the barrier, so no
+        # thread can pick up a second one
+        barrier = threading.Barrier(self._reader_count)
+
+        def close_reader():
+            try:
+                barrier.wait(timeout=10)
+            except threading.BrokenBarrierError:
+                pass
+            db = getattr(self._local, "db", None)
+            if db is not None:
+                self._local.db = None
+                db.close()
+
+        for future in [self._readers.submit(close_reader) for _ in range(self._reader_count)]:
+            future.result()
+        self._readers.shutdown(wait=True)
+        self._writer.submit(self._writer_db.close).result()
+        self._writer.shutdown(wait=True)
+
+
+class BufferedStatusWriter:
+    """
+    Collects media_status upserts and writes them in one transaction once
+    `max_rows` are buffered or `max_age` seconds have passed. Call `flush()`
+    at page boundaries and before the run ends.
+    """
+
+    def __init__(self, db: AsyncDatabase, max_rows: int = 500, max_age: float = 2.0):
+        self.db = db
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.rows: List[Tuple] = []
+        self.last_flush = time.monotonic()
+
+    async def add(
+        self,
+        emby_id: str,
+        name: str,
+        path: str,
+        status: str,
+        meta_info: Optional[str] = None,
+        increment_retry: bool = False,
+        library_id: Optional[str] = None,
+        fingerprint: Optional[int] = None,
+    ):
+        self.rows.append(
+            Database._status_row(emby_id, name, path, status, meta_info, increment_retry, library_id, fingerprint)
+        )
+        if len(self.rows) >= self.max_rows or time.monotonic() - self.last_flush >= self.max_age:
+            await self.flush()
+
+    async def flush(self) -> int:
+        rows, self.rows = self.rows, []
+        if rows:
+            await self.db.set_media_status_many(rows)
+        self.last_flush = time.monotonic()
+        return len(rows)
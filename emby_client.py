@@ -1,10 +1,69 @@
+import asyncio
+import hashlib
 import httpx
 import logging
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from json_stream import ItemListParser
 
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401  (optional, enables HTTP/2)
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+# Extra item fields that change whenever Emby re-saves an item (DateLastSaved
+# stands in on servers that return no Etag); together with the path and
+# whether streams are known they make up the scan fingerprint.
+FINGERPRINT_FIELDS = "Etag,DateLastSaved"
+
+
+def item_fingerprint(item: Dict) -> int:
+    """Stable 64-bit fingerprint of the item fields a scan decides on."""
+    key = "\0".join((
+        item.get("Path") or "",
+        item.get("Etag") or item.get("DateLastSaved") or "",
+        "1" if item.get("MediaStreams") else "0",
+    ))
+    digest = hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+# What a scan reads from a listed item: identity, path, fingerprint inputs
+# and the probe priority inputs. Everything else is dropped while parsing.
+SCAN_ITEM_KEYS = ("Id", "Name", "Path", "Etag", "DateLastSaved", "DateCreated")
+SCAN_USER_DATA_KEYS = ("IsFavorite", "LastPlayedDate")
+
+# Listing order for get_items; checkpoint cursors are offsets into it
+LIST_SORT_BY = "DateCreated,SortName"
+
+
+def scan_item(item: Dict) -> Dict:
+    """The part of a listed item a scan needs; MediaStreams only has to tell whether there are any."""
+    slim = {key: item[key] for key in SCAN_ITEM_KEYS if key in item}
+    if "MediaStreams" in item:
+        slim["MediaStreams"] = (item["MediaStreams"] or [])[:1]
+    user_data = item.get("UserData")
+    if user_data:
+        slim["UserData"] = {key: user_data[key] for key in SCAN_USER_DATA_KEYS if key in user_data}
+    return slim
+
+
 class EmbyClient:
-    def __init__(self, host: str, api_key: str, user_id: str):
+    def __init__(
+        self,
+        host: str,
+        api_key: str,
+        user_id: str,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ):
         self.host = host.rstrip('/')
         self.api_key = api_key
         self.user_id = user_id
@@ -12,70 +71,229 @@ class EmbyClient:
             "X-Emby-Token": self.api_key,
             "Content-Type": "application/json"
         }
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not HAS_HTTP2:
+            logger.warning("HTTP/2 已启用但未安装 h2 依赖，回退到 HTTP/1.1")
+        self.http2 = http2 and HAS_HTTP2
+        self._client: Optional[httpx.AsyncClient] = None
+        # Alternative transport (e.g. httpx.ASGITransport for benchmarks); set before first use
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        self.pool_stats = {"requests": 0, "connections_opened": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, created lazily on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self.transport,
+                event_hooks={"request": [self._on_request]},
+            )
+        return self._client
+
+    async def _on_request(self, request: httpx.Request):
+        self.pool_stats["requests"] += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event: str, info: dict):
+        # A TCP connect only happens when the pool has no reusable connection.
+        if event == "connection.connect_tcp.complete":
+            self.pool_stats["connections_opened"] += 1
+
+    def get_pool_stats(self) -> Dict:
+        requests = self.pool_stats["requests"]
+        opened = self.pool_stats["connections_opened"]
+        stats = {
+            "host": self.host,
+            "http2": self.http2,
+            "requests": requests,
+            "connections_opened": opened,
+            "reused": max(requests - opened, 0),
+            "open_connections": 0,
+            "idle_connections": 0,
+        }
+        if self._client is not None and not self._client.is_closed:
+            try:
+                connections = self._client._transport._pool.connections
+                stats["open_connections"] = len(connections)
+                stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            except AttributeError:
+                pass
+        return stats
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def validate_connection(self):
         url = f"{self.host}/System/Info"
-        async with httpx.AsyncClient() as client:
-            logger.info(f"验证连接 [GET]: {url}")
-            resp = await client.get(url, headers=self.headers, timeout=10.0)
-            resp.raise_for_status()
-            return True
+        logger.info(f"验证连接 [GET]: {url}")
+        resp = await self.client.get(url, timeout=10.0)
+        resp.raise_for_status()
+        return True
 
     async def get_user_info(self):
         """Fetch user info to validate identity."""
         url = f"{self.host}/Users/{self.user_id}"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=self.headers, timeout=10.0)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self.client.get(url, timeout=10.0)
+        resp.raise_for_status()
+        return resp.json()
 
     async def get_libraries(self):
         """Get all media libraries."""
         url = f"{self.host}/Users/{self.user_id}/Views"
-        async with httpx.AsyncClient() as client:
-            logger.info(f"获取媒体库 [GET]: {url}")
-            resp = await client.get(url, headers=self.headers, timeout=10.0)
-            resp.raise_for_status()
-            return resp.json().get("Items", [])
+        logger.info(f"获取媒体库 [GET]: {url}")
+        resp = await self.client.get(url, timeout=10.0)
+        resp.raise_for_status()
+        return resp.json().get("Items", [])
+
+    async def get_virtual_folders(self) -> List[Dict]:
+        """Libraries with their folder paths (`ItemId`, `Name`, `Locations`)."""
+        url = f"{self.host}/Library/VirtualFolders"
+        resp = await self.client.get(url, timeout=10.0)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_items(
+        self,
+        parent_id: str,
+        min_date_last_saved: str = None,
+        page_size: int = 500,
+        concurrency: int = 1,
+        lean: bool = False,
+        start_index: int = 0,
+        extra_fields: str = "",
+        user_data: bool = False,
+    ):
+        """
+        Yield the library's items page by page, oldest first (LIST_SORT_BY),
+        starting at `start_index` (used to resume a checkpointed run). `extra_fields`
+        and `user_data` add what the probe priority policy scores on.
 
-    async def get_items(self, parent_id: str, min_date_last_saved: str = None):
+        Once the first page reports TotalRecordCount, up to `concurrency`
+        further pages are fetched ahead in parallel. In `lean` mode pages only
+        carry Path; MediaStreams are then fetched just for the .strm items of
+        each page, since those are the only ones the task looks at.
+
+        Pages are parsed as they stream in and items are cut down to
+        `scan_item` on the way, so a page never exists as a full document.
+        An item repeated by a neighbouring page is yielded only once, so a
+        page may come out shorter than `page_size`.
+        """
         url = f"{self.host}/Users/{self.user_id}/Items"
-        start_index = 0
-        limit = 500
-        async with httpx.AsyncClient() as client:
-            while True:
-                params = {
-                    "ParentId": parent_id,
-                    "Recursive": "true",
-                    "IncludeItemTypes": "Movie,Episode,Audio",
-                    "Fields": "Path,MediaStreams,ProviderIds",
-                    "StartIndex": start_index,
-                    "Limit": limit,
-                }
-                if min_date_last_saved:
-                    params["MinDateLastSaved"] = min_date_last_saved
-                logger.info(f"[分页] 获取第 {start_index} - {start_index + limit} 条记录...")
-                logger.info(f"正在获取列表 [GET]: {url} | 参数: {params}")
-                resp = await client.get(url, headers=self.headers, params=params, timeout=60.0)
+
+        async def fetch_page(start_index: int):
+            params = {
+                "ParentId": parent_id,
+                "Recursive": "true",
+                "IncludeItemTypes": "Movie,Episode,Audio",
+                # A stable order keeps StartIndex meaningful across pages and
+                # restarts; items added meanwhile append at the end
+                "SortBy": LIST_SORT_BY,
+                "SortOrder": "Ascending",
+                "Fields": ",".join(filter(None, ["Path" if lean else "Path,MediaStreams", extra_fields])),
+                "StartIndex": start_index,
+                "Limit": page_size,
+                "EnableImages": "false",
+                "EnableUserData": "true" if user_data else "false",
+            }
+            if min_date_last_saved:
+                params["MinDateLastSaved"] = min_date_last_saved
+            logger.info(f"[分页] 获取第 {start_index} - {start_index + page_size} 条记录...")
+            logger.info(f"正在获取列表 [GET]: {url} | 参数: {params}")
+            parser = ItemListParser(scan_item)
+            items = []
+            async with self.client.stream("GET", url, params=params, timeout=60.0) as resp:
                 resp.raise_for_status()
-                items = resp.json().get("Items", [])
+                async for chunk in resp.aiter_bytes():
+                    items.extend(parser.feed(chunk))
+            items.extend(parser.close())
+            if lean:
+                await self._attach_media_streams(items)
+            return items, parser.fields.get("TotalRecordCount")
+
+        # Pages fetched at different times overlap when the library changes in
+        # between (an item pushed across a page boundary); remembering the ids
+        # of the last few pages is enough to drop those repeats
+        recent: deque = deque(maxlen=max(concurrency, 1) + 1)
+
+        def unseen(items):
+            fresh = [item for item in items if not any(item.get("Id") in ids for ids in recent)]
+            recent.append({item.get("Id") for item in items})
+            return fresh
+
+        items, total = await fetch_page(start_index)
+        if not items:
+            return
+        yield unseen(items)
+        if total is None:
+            # Server did not report a total: page sequentially until empty
+            start_index += page_size
+            while True:
+                items, _ = await fetch_page(start_index)
+                if not items:
+                    break
+                items = unseen(items)
+                if items:
+                    yield items
+                start_index += page_size
+            return
+
+        starts = iter(range(start_index + page_size, total, page_size))
+        pending = deque()
+
+        def schedule():
+            start_index = next(starts, None)
+            if start_index is not None:
+                pending.append(asyncio.create_task(fetch_page(start_index)))
+
+        for _ in range(max(concurrency, 1)):
+            schedule()
+        try:
+            while pending:
+                items, _ = await pending.popleft()
+                schedule()
                 if not items:
                     break
-                yield items
-                start_index += limit
+                items = unseen(items)
+                if items:
+                    yield items
+        finally:
+            for task in pending:
+                task.cancel()
 
-    async def refresh_item(self, item_id: str):
+    async def _attach_media_streams(self, items, chunk_size: int = 100):
+        strm_ids = [
+            item["Id"] for item in items
+            if item.get("Id") and (item.get("Path") or "").lower().endswith(".strm")
+        ]
+        streams = {}
+        for i in range(0, len(strm_ids), chunk_size):
+            for detail in await self.get_items_by_ids(strm_ids[i : i + chunk_size]):
+                streams[detail.get("Id")] = (detail.get("MediaStreams") or [])[:1]
+        for item in items:
+            if item.get("Id") in streams:
+                item["MediaStreams"] = streams[item["Id"]]
+
+    async def refresh_item(self, item_id: str, timeout: float = 120.0):
         """
         Force Emby to probe the file by requesting PlaybackInfo with extremely low bitrate.
         This forces ffmpeg probe because Emby thinks bandwidth is insufficient for direct play.
         """
         url = f"{self.host}/Items/{item_id}/PlaybackInfo"
-        
+
         # We use POST with a body to simulate a real playback request
         # MaxStreamingBitrate=1 forces transcoding check which triggers probe
         data = {
             "UserId": self.user_id,
-            "MaxStreamingBitrate": 1, 
+            "MaxStreamingBitrate": 1,
             "StartTimeTicks": 0,
             "AudioStreamIndex": 0,
             "SubtitleStreamIndex": -1,
@@ -84,18 +302,101 @@ class EmbyClient:
             "EnableDirectPlay": False,
             "EnableDirectStream": False
         }
-        
+
         logger.debug(f"Refreshing item {item_id} via {url} with data: {data}")
-        async with httpx.AsyncClient() as client:
-            logger.info(f"触发探测 [POST]: {url} | 码率限制: {data.get('MaxStreamingBitrate')}")
-            resp = await client.post(url, headers=self.headers, json=data, timeout=120.0)
-            resp.raise_for_status()
-            return True
+        logger.info(f"触发探测 [POST]: {url} | 码率限制: {data.get('MaxStreamingBitrate')}")
+        resp = await self.client.post(url, json=data, timeout=timeout)
+        resp.raise_for_status()
+        return True
+
+    async def get_items_by_ids(self, item_ids, extra_fields: str = "", user_data: bool = False):
+        """Fetch several items (with MediaStreams) in one request."""
+        url = f"{self.host}/Users/{self.user_id}/Items"
+        params = {
+            "Ids": ",".join(item_ids),
+            "Fields": ",".join(filter(None, ["Path,MediaStreams", extra_fields])),
+        }
+        if user_data:
+            params["EnableUserData"] = "true"
+        resp = await self.client.get(url, params=params, timeout=30.0)
+        resp.raise_for_status()
+        return resp.json().get("Items", [])
 
     async def get_item_details(self, item_id: str):
         """Fetch full item details to verify MediaStreams."""
         url = f"{self.host}/Users/{self.user_id}/Items/{item_id}"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=self.headers, timeout=10.0)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self.client.get(url, timeout=10.0)
+        resp.raise_for_status()
+        return resp.json()
+
+
+# One pooled client per configured server, shared by the API and the task runner.
+_clients: Dict[str, Tuple[Tuple, EmbyClient]] = {}
+# Clients replaced by a config change. Runs started before the change keep
+# using theirs, so each is closed only once it has sat idle for RETIRE_GRACE.
+_retired: Dict[EmbyClient, asyncio.Task] = {}
+RETIRE_GRACE = 120.0
+
+
+def _client_settings(config) -> Tuple:
+    return (
+        config.api_key,
+        config.user_id,
+        config.http_max_connections,
+        config.http_max_keepalive,
+        config.http_keepalive_expiry,
+        config.http2,
+    )
+
+
+async def _close_when_idle(client: EmbyClient):
+    try:
+        seen = None
+        while client.pool_stats["requests"] != seen:
+            seen = client.pool_stats["requests"]
+            await asyncio.sleep(RETIRE_GRACE)
+        await client.close()
+    finally:
+        _retired.pop(client, None)
+
+
+def _retire(client: EmbyClient):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # no loop: the client never opened a pool on one
+    _retired[client] = loop.create_task(_close_when_idle(client))
+
+
+def get_emby_client(config) -> EmbyClient:
+    host = config.emby_host.rstrip('/')
+    settings = _client_settings(config)
+    # Only the configured server is kept; a changed host or setting replaces it
+    for other in [h for h, (s, _) in _clients.items() if h != host or s != settings]:
+        _retire(_clients.pop(other)[1])
+    entry = _clients.get(host)
+    if entry is None:
+        client = EmbyClient(
+            config.emby_host,
+            config.api_key,
+            config.user_id,
+            max_connections=config.http_max_connections,
+            max_keepalive=config.http_max_keepalive,
+            keepalive_expiry=config.http_keepalive_expiry,
+            http2=config.http2,
+        )
+        entry = _clients[host] = (settings, client)
+    return entry[1]
+
+
+def get_all_pool_stats():
+    return [client.get_pool_stats() for _, client in _clients.values()]
+
+
+async def close_all_clients():
+    for task in list(_retired.values()):
+        task.cancel()
+    for client in [client for _, client in _clients.values()] + list(_retired):
+        await client.close()
+    _clients.clear()
+    _retired.clear()
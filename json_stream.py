@@ -0,0 +1,119 @@
+import codecs
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class _Incomplete(Exception):
+    """The value at the cursor continues in a later chunk."""
+
+
+class ItemListParser:
+    """
+    Incremental parser for `{"Items": [...], "TotalRecordCount": n}` bodies.
+
+    Bytes are fed as they arrive and every item is handed out as soon as its
+    closing brace is in, after passing through `keep` (which may drop fields
+    or return None to skip the item). A page is thus never held as one
+    parsed document, and only what `keep` returns outlives its item. The
+    other top-level fields end up in `fields`.
+    """
+
+    def __init__(self, keep: Optional[Callable[[Dict], Optional[Dict]]] = None, list_key: str = "Items"):
+        self.keep = keep
+        self.list_key = list_key
+        self.fields: Dict[str, Any] = {}
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[Dict]:
+        """Parse another chunk; returns the items it completed."""
+        self._buf = self._buf[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> List[Dict]:
+        """End of body: returns the last items, or raises ValueError if it was cut short."""
+        self._buf = self._buf[self._pos:] + self._text.decode(b"", final=True)
+        self._pos = 0
+        items = self._parse(final=True)
+        if self._state != "done":
+            raise ValueError("truncated item list")
+        return items
+
+    def _skip(self) -> Optional[str]:
+        """Next non-blank character, or None when the buffer is used up."""
+        self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        return self._buf[self._pos] if self._pos < len(self._buf) else None
+
+    def _value(self, final: bool):
+        """Decode the value at the cursor; raises _Incomplete while it is incomplete."""
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise ValueError(f"invalid JSON at offset {self._pos}")
+            raise _Incomplete
+        # A number at the very end may continue in the next chunk
+        if end == len(self._buf) and not final:
+            raise _Incomplete
+        self._pos = end
+        return value
+
+    def _expect(self, char: str, expected: str):
+        if char != expected:
+            raise ValueError(f"expected {expected!r} at offset {self._pos}, got {char!r}")
+        self._pos += 1
+
+    def _parse(self, final: bool) -> List[Dict]:
+        items: List[Dict] = []
+        try:
+            while self._state != "done":
+                char = self._skip()
+                if char is None:
+                    break
+                if self._state == "start":
+                    self._expect(char, "{")
+                    self._state = "key"
+                elif self._state == "key":
+                    if char == "}":
+                        self._pos += 1
+                        self._state = "done"
+                        continue
+                    if char == ",":
+                        self._pos += 1
+                        continue
+                    self._key = self._value(final)
+                    self._state = "colon"
+                elif self._state == "colon":
+                    self._expect(char, ":")
+                    self._state = "value"
+                elif self._state == "value":
+                    if self._key == self.list_key and char == "[":
+                        self._pos += 1
+                        self._state = "items"
+                    else:
+                        self.fields[self._key] = self._value(final)
+                        self._state = "key"
+                elif self._state == "items":
+                    if char == "]":
+                        self._pos += 1
+                        self._state = "key"
+                        continue
+                    if char == ",":
+                        self._pos += 1
+                        continue
+                    item = self._value(final)
+                    if self.keep is not None:
+                        item = self.keep(item)
+                    if item is not None:
+                        items.append(item)
+        except _Incomplete:
+            pass  # wait for more data
+        return items
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the target is gone. Anything else (timeouts, 5xx, a
+# throttling drive answering 403/429) is unclear and left for Emby to probe.
+DEAD_STATUS = {404, 410}
+
+
+def parse_path_map(text: str) -> List[Tuple[str, str]]:
+    """`strm_path_map` lines: `<emby_prefix> <local_prefix>`, longest prefix first."""
+    mapping = []
+    for line in (text or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            mapping.append((parts[0], parts[1]))
+        elif parts:
+            logger.warning(f"忽略无效的路径映射配置: {line!r}")
+    mapping.sort(key=lambda m: len(m[0]), reverse=True)
+    return mapping
+
+
+class StrmPrecheck:
+    """
+    Checks .strm targets locally before any Emby call.
+
+    The .strm files are read from the container's mount on a thread pool,
+    then every distinct target is checked once: http(s) URLs with a HEAD
+    (or a one-byte ranged GET when HEAD is refused), at most `per_host`
+    at a time per host; local targets by looking at the file system. Only
+    clearly dead targets are reported; an unreadable .strm or an unclear
+    answer lets the item through to the normal probe.
+    """
+
+    def __init__(self, path_map: List[Tuple[str, str]], per_host: int = 4, timeout: float = 10.0, readers: int = 8):
+        self.path_map = path_map
+        self.per_host = max(int(per_host), 1)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="strm-reader")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        # url -> dead reason, or None when alive/unclear; one check per run
+        self._results: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def from_config(cls, config) -> "StrmPrecheck":
+        return cls(
+            parse_path_map(config.strm_path_map),
+            per_host=config.strm_check_per_host,
+            timeout=config.strm_check_timeout,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Separate from the Emby client: the API key must not go to link hosts
+        if self._client is None:
+            self._client = httpx.AsyncClient(follow_redirects=True, timeout=self.timeout)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._executor.shutdown(wait=False)
+
+    def local_path(self, path: str) -> str:
+        for emby_prefix, local_prefix in self.path_map:
+            if path.startswith(emby_prefix):
+                return local_prefix + path[len(emby_prefix):]
+        return path
+
+    @staticmethod
+    def _read_target(local_path: str) -> Optional[str]:
+        """First non-comment line of the .strm, "" if it has none, None if unreadable."""
+        try:
+            with open(local_path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read(4096)
+        except OSError:
+            return None
+        for line in content.splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                return line
+        return ""
+
+    @staticmethod
+    def _local_target_missing(path: str) -> bool:
+        # Only trust "missing" when the directory is visible, i.e. the mount is there
+        return os.path.isdir(os.path.dirname(path)) and not os.path.exists(path)
+
+    async def find_dead(self, items: List[Dict]) -> Dict[str, str]:
+        """Map item id -> reason for the items whose .strm target is dead."""
+        loop = asyncio.get_running_loop()
+        targets = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._read_target, self.local_path(item.get("Path") or ""))
+            for item in items
+        ))
+        dead: Dict[str, str] = {}
+        by_target: Dict[str, List[str]] = {}
+        for item, target in zip(items, targets):
+            if target is None:
+                continue
+            if target == "":
+                dead[item["Id"]] = "空 .strm 文件"
+            else:
+                by_target.setdefault(target, []).append(item["Id"])
+        unique = list(by_target)
+        reasons = await asyncio.gather(*(self._check(target) for target in unique))
+        for target, reason in zip(unique, reasons):
+            if reason:
+                for item_id in by_target[target]:
+                    dead[item_id] = reason
+        return dead
+
+    async def _check(self, target: str) -> Optional[str]:
+        if target in self._results:
+            return self._results[target]
+        parts = urlsplit(target)
+        reason = None
+        if parts.scheme in ("http", "https"):
+            slots = self._host_slots.get(parts.netloc)
+            if slots is None:
+                slots = self._host_slots[parts.netloc] = asyncio.Semaphore(self.per_host)
+            async with slots:
+                reason = await self._check_http(target)
+        elif parts.scheme in ("", "file"):
+            path = self.local_path(parts.path if parts.scheme == "file" else target)
+            missing = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._local_target_missing, path
+            )
+            if missing:
+                reason = "目标文件不存在"
+        self._results[target] = reason
+        return reason
+
+    async def _check_http(self, url: str) -> Optional[str]:
+        try:
+            resp = await self.client.head(url)
+            status = resp.status_code
+            if status in (405, 501):
+                # HEAD not supported: ask for a single byte instead
+                async with self.client.stream("GET", url, headers={"Range": "bytes=0-0"}) as resp:
+                    status = resp.status_code
+        except httpx.HTTPError as e:
+            logger.debug(f"预检请求失败 {url}: {e}")
+            return None
+        if status in DEAD_STATUS:
+            return f"HTTP {status}"
+        return None
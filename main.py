@@ -1,18 +1,24 @@
 from fastapi import FastAPI, Request, WebSocket, HTTPException, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import hmac
 import uvicorn
 import logging
 import os
 import traceback
+from contextlib import asynccontextmanager
 from logging.handlers import RotatingFileHandler
 
-from config import load_config, save_config, AppConfig
-from emby_client import EmbyClient
+from config import load_config, save_config, watch_config, AppConfig
+from emby_client import get_emby_client, get_all_pool_stats, close_all_clients
 from task_manager import task_manager, manager
-from database import Database
+from scheduler import run_schedules
+from metrics import render_metrics
+from webhook import WebhookIntake, parse_notification, read_payload
 
 # Logging setup
 os.makedirs("data", exist_ok=True)
@@ -32,15 +38,42 @@ logging.getLogger("uvicorn").setLevel(logging.WARNING)
 logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
 logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
 
-app = FastAPI(title="Emby Strm Doctor")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    schedule_task = asyncio.create_task(run_schedules(task_manager, load_config))
+    # Hand edits to data/config.json reach running tasks too, not only saves
+    config_task = asyncio.create_task(watch_config())
+    # Runs interrupted by a restart carry on from their checkpoints
+    try:
+        await task_manager.resume_interrupted()
+    except Exception as e:
+        logger.error(f"恢复中断任务失败: {e}")
+    yield
+    schedule_task.cancel()
+    config_task.cancel()
+    # Running jobs stop first (their checkpoints resume on the next start);
+    # only then are the pooled Emby connections and DB threads released
+    await task_manager.shutdown()
+    await close_all_clients()
+    task_manager.db.close()
+
+app = FastAPI(title="Emby Strm Doctor", lifespan=lifespan)
+
+# New items announced by Emby notifications, debounced into batched lookups
+webhook_intake = WebhookIntake(task_manager.submit_new_items)
 
 # Create templates directory if not exists (handled by mkdir)
 templates = Jinja2Templates(directory="templates")
 
 class StartRequest(BaseModel):
-    library_id: str
+    library_id: Optional[str] = None
+    library_ids: List[str] = []
+    all_libraries: bool = False
     force: bool = False
 
+class StopRequest(BaseModel):
+    library_id: Optional[str] = None  # None stops every job
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -60,7 +93,7 @@ async def get_libraries():
     if not config.emby_host or not config.api_key or not config.user_id:
         raise HTTPException(status_code=400, detail="Emby configuration missing")
     
-    client = EmbyClient(config.emby_host, config.api_key, config.user_id)
+    client = get_emby_client(config)
     try:
         libraries = await client.get_libraries()
         return libraries
@@ -70,31 +103,76 @@ async def get_libraries():
 
 @app.get("/api/status")
 async def get_status():
-    db = Database()
+    # Shared async DB: reads run on a pooled connection, off the event loop
+    db = task_manager.db
     return {
         "is_running": task_manager.is_running,
         "current_library_id": getattr(task_manager, "current_library_id", None),
-        "statistics": getattr(task_manager, "stats", {"total": 0, "processed": 0, "success": 0}),
-        "db_stats": db.get_stats(),
+        "statistics": getattr(task_manager, "stats", {"scanned": 0, "total": 0, "processed": 0, "success": 0}),
+        "db_stats": await db.get_stats(),
+        "http_pool": get_all_pool_stats(),
+        "jobs": task_manager.get_jobs(),
     }
 
+@app.get("/api/items")
+async def browse_items(
+    status: Optional[str] = None,
+    library_id: Optional[str] = None,
+    path_prefix: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+):
+    # Keyset paging: pass back `next_cursor` to get the following page
+    limit = max(1, min(limit, 500))
+    items, next_cursor = await task_manager.db.browse_media_status(status, library_id, path_prefix, limit, cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/api/webhook")
+async def webhook(request: Request, token: Optional[str] = None):
+    # Emby webhook target: library.new notifications (or {"ItemIds": [...]})
+    config = load_config()
+    if config.webhook_token and not hmac.compare_digest(token or "", config.webhook_token):
+        raise HTTPException(status_code=403, detail="Invalid webhook token")
+    item_ids = parse_notification(await read_payload(request))
+    webhook_intake.debounce = config.webhook_debounce
+    added = webhook_intake.add(item_ids)
+    return {"status": "accepted", "items": len(item_ids), "queued": added}
+
 @app.post("/api/start")
 async def start_task(req: StartRequest):
-    success, msg = await task_manager.start_task(req.library_id, req.force)
+    if req.all_libraries:
+        try:
+            success, msg = await task_manager.enqueue_all(req.force)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=str(e))
+    else:
+        library_ids = list(req.library_ids)
+        if req.library_id:
+            library_ids.insert(0, req.library_id)
+        if not library_ids:
+            raise HTTPException(status_code=400, detail="No library selected")
+        success, msg = await task_manager.enqueue(library_ids, req.force)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"status": "success", "message": msg}
 
 @app.post("/api/stop")
-async def stop_task():
-    success, msg = await task_manager.stop_task()
+async def stop_task(req: Optional[StopRequest] = None):
+    success, msg = await task_manager.stop_task(req.library_id if req else None)
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"status": "success", "message": msg}
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: int = 0, epoch: Optional[str] = None):
+    # `since`/`epoch` come from the client's last frame, so a reconnect only replays what it missed
+    await manager.connect(websocket, since, epoch)
     try:
         while True:
             # Keep connection alive, maybe wait for commands if needed
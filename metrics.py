@@ -0,0 +1,164 @@
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Small in-process metrics registry rendered in the Prometheus text format
+# (version 0.0.4). Metrics are only touched from the event loop, so no locking.
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in sorted(self.values.items())]
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or computed at scrape time by `collector`."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.collector: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        values = dict(self.values)
+        if self.collector is not None:
+            values.update(self.collector())
+        return [f"{self.name}{self._labels(key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [per-bucket counts, sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * len(self.buckets), 0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = self._labels(key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+ITEMS_SCANNED = Counter("strm_doctor_items_scanned_total", "Items enumerated from Emby.", ["library"])
+ITEMS_IGNORED = Counter(
+    "strm_doctor_items_ignored_total",
+    "Items skipped by path rules, because they already have media info, or as unchanged since last ignored.",
+    ["library", "reason"],
+)
+ITEMS_PROBED = Counter("strm_doctor_items_probed_total", "PlaybackInfo probes sent.", ["backend"])
+ITEMS_SUCCEEDED = Counter("strm_doctor_items_succeeded_total", "Items verified with MediaStreams.", ["backend"])
+ITEMS_FAILED = Counter("strm_doctor_items_failed_total", "Items whose probe or verification failed.", ["backend"])
+PROBE_TIMEOUTS = Counter(
+    "strm_doctor_probe_timeouts_total", "Probes abandoned at their deadline, to be retried later.", ["backend"]
+)
+RATE_LIMIT_HITS = Counter(
+    "strm_doctor_rate_limit_hits_total", "HTTP 403/429 responses to probes.", ["backend", "status"]
+)
+REFRESH_LATENCY = Histogram(
+    "strm_doctor_refresh_item_seconds", "Latency of the PlaybackInfo probe request.", ["backend"]
+)
+VERIFY_LATENCY = Histogram(
+    "strm_doctor_verify_seconds", "Time from a finished probe until its item details are verified.", ["backend"]
+)
+VERIFY_QUERY_LATENCY = Histogram(
+    "strm_doctor_verify_query_seconds", "Latency of one batched item-details lookup."
+)
+QUEUE_DEPTH = Gauge("strm_doctor_queue_depth", "Items waiting in the per-backend probe queues.", ["backend"])
+PROBES_IN_FLIGHT = Gauge("strm_doctor_probes_in_flight", "Probe requests currently in flight.", ["backend"])
@@ -0,0 +1,116 @@
+import fnmatch
+import re
+from typing import Dict, List, Optional, Tuple
+
+PREFIX_MARK = "^"
+GLOB_MARK = "glob:"
+
+
+class PrefixTrie:
+    """Character trie over lowercased prefixes; finds the longest prefix of a path."""
+
+    def __init__(self):
+        self.root: Dict = {}
+
+    def add(self, prefix: str, rule: str):
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[None] = rule
+
+    def longest_match(self, text: str) -> Optional[str]:
+        node = self.root
+        found = node.get(None)
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+
+class _RuleSet:
+    def __init__(self, lines: List[str]):
+        self.trie = PrefixTrie()
+        self.globs: List[Tuple[str, re.Pattern]] = []
+        self.keywords: Dict[str, str] = {}
+        self.rules: List[str] = []
+        for line in lines:
+            rule = line.strip()
+            if not rule:
+                continue
+            pattern = rule.lower()
+            if pattern.startswith(GLOB_MARK):
+                pattern = pattern[len(GLOB_MARK):].strip()
+                if pattern:
+                    self.globs.append((rule, re.compile(fnmatch.translate(pattern), re.DOTALL)))
+            elif pattern.startswith(PREFIX_MARK):
+                pattern = pattern[len(PREFIX_MARK):].strip()
+                if pattern:
+                    self.trie.add(pattern, rule)
+            else:
+                self.keywords.setdefault(pattern, rule)
+            self.rules.append(rule)
+        # Plain lines match anywhere in the path, all in one regex pass
+        self.keyword_regex = (
+            re.compile("|".join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True)))
+            if self.keywords else None
+        )
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, p_lower: str) -> Optional[str]:
+        rule = self.trie.longest_match(p_lower)
+        if rule is not None:
+            return rule
+        if self.keyword_regex is not None:
+            found = self.keyword_regex.search(p_lower)
+            if found is not None:
+                return self.keywords[found.group(0)]
+        for rule, regex in self.globs:
+            if regex.match(p_lower):
+                return rule
+        return None
+
+
+class PathRules:
+    """
+    Include/exclude rules compiled once per run. One rule per line,
+    matched case-insensitively:
+
+    * a plain line matches anywhere in the path, as it always has,
+    * "^/mnt/a/" only matches paths starting with "/mnt/a/" (through a trie),
+    * "glob:*/extras/*.strm" is a glob over the whole path (* ? [..]).
+
+    When include rules are present a path must match one of them; exclude
+    rules always win. Hits are counted per rule for the run summary.
+    """
+
+    NOT_INCLUDED = "(未匹配包含规则)"
+
+    def __init__(self, include_lines: List[str], exclude_lines: List[str]):
+        self.includes = _RuleSet(include_lines)
+        self.excludes = _RuleSet(exclude_lines)
+        self.hits: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config) -> "PathRules":
+        return cls(
+            (config.include_paths or "").splitlines(),
+            (config.exclude_paths or "").splitlines(),
+        )
+
+    def check(self, path: str) -> Optional[str]:
+        """Return the rule that rejects `path`, or None if it should be processed."""
+        p_lower = (path or "").lower()
+        rule = self.excludes.match(p_lower)
+        if rule is None and self.includes and self.includes.match(p_lower) is None:
+            rule = self.NOT_INCLUDED
+        if rule is not None:
+            self.hits[rule] = self.hits.get(rule, 0) + 1
+        return rule
+
+    def summary(self) -> str:
+        return ", ".join(f"{rule} × {count}" for rule, count in sorted(self.hits.items(), key=lambda kv: -kv[1]))
@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Scoring keys for `probe_priority`, most significant first, e.g.
+# "favorites newest". Library weights are not a key here: the shared probe
+# budget already splits probes between libraries by `library_weights`.
+PRIORITY_KEYS = ("newest", "favorites", "recent", "retries")
+
+_KEY_WIDTH = 11
+_KEY_MAX = 10 ** _KEY_WIDTH - 1
+
+
+def _epoch(value: Optional[str]) -> Optional[int]:
+    """Emby timestamp ("2024-01-01T00:00:00.0000000Z") -> unix seconds."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return None
+    return int(parsed.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+class ProbePriority:
+    """
+    Turns an item into a sort key for the probe queue; smaller goes first.
+
+    Each key contributes a fixed-width decimal field, so the concatenation
+    sorts correctly as text (in SQLite as well as in the heap):
+    `newest` by DateCreated, `recent` by UserData.LastPlayedDate, both
+    latest first; `favorites` puts UserData.IsFavorite first; `retries`
+    puts items with fewer failed attempts first. No keys keeps scan order.
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = keys
+
+    @classmethod
+    def parse(cls, text: str) -> "ProbePriority":
+        keys = []
+        for part in (text or "").replace(",", " ").split():
+            part = part.lower()
+            if part in PRIORITY_KEYS:
+                if part not in keys:
+                    keys.append(part)
+            elif part not in ("none", "fifo"):
+                logger.warning(f"忽略未知的探测优先级: {part!r}")
+        return cls(keys)
+
+    @classmethod
+    def from_config(cls, config) -> "ProbePriority":
+        return cls.parse(config.probe_priority)
+
+    @property
+    def fields(self) -> str:
+        """Extra item Fields the keys need from Emby."""
+        return "DateCreated" if "newest" in self.keys else ""
+
+    @property
+    def user_data(self) -> bool:
+        return "favorites" in self.keys or "recent" in self.keys
+
+    def key(self, item: Dict, status_row: Optional[Dict] = None) -> str:
+        user_data = item.get("UserData") or {}
+        parts = []
+        for name in self.keys:
+            if name == "newest" or name == "recent":
+                stamp = _epoch(item.get("DateCreated") if name == "newest" else user_data.get("LastPlayedDate"))
+                value = _KEY_MAX - min(max(stamp, 0), _KEY_MAX) if stamp is not None else _KEY_MAX
+            elif name == "favorites":
+                value = 0 if user_data.get("IsFavorite") else 1
+            else:
+                value = int((status_row or {}).get("retry_count") or 0)
+            parts.append(f"{value:0{_KEY_WIDTH}d}")
+        return "".join(parts)
+
+
+class ProbeQueue:
+    """
+    One backend's probe queue for one library run.
+
+    The queued items live in the run's checkpoint (`run_pending`), not in
+    memory: the scanner writes each page there with its priority and calls
+    `added`, and workers pull from here. When the small in-memory heap runs
+    dry it claims the best `prefetch` unclaimed rows, so an item found late
+    in the scan still overtakes everything worse that is waiting, and the
+    scan never has to wait for the probes.
+    """
+
+    def __init__(self, db, library_id: str, backend: str, prefetch: int = 8):
+        self.db = db
+        self.library_id = library_id
+        self.backend = backend
+        self.prefetch = max(int(prefetch), 1)
+        self._heap: List[Tuple[str, int, str, Dict]] = []
+        self._waiting = 0
+        self._maybe_more = False
+        self._generation = 0
+        self._scan_done = False
+        self._closed = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def qsize(self) -> int:
+        """Items queued and not yet handed to a worker."""
+        return self._waiting
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def added(self, count: int):
+        """`count` new rows were written for this backend."""
+        self._waiting += count
+        self._maybe_more = True
+        self._generation += 1
+        self._wake()
+
+    def finish(self):
+        """No more rows will be added: workers exit once the queue is drained."""
+        self._scan_done = True
+        self._wake()
+
+    def close(self):
+        """Stop handing out items; whatever is left stays in the checkpoint."""
+        self._closed = True
+        self._wake()
+
+    async def get(self) -> Optional[Dict]:
+        """Next item to probe, or None once the queue is finished or closed."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+        while not self._closed:
+            if self._heap:
+                self._waiting -= 1
+                return heapq.heappop(self._heap)[3]
+            if self._maybe_more:
+                generation = self._generation
+                async with self._lock:
+                    # Another worker may have refilled the heap meanwhile
+                    if self._heap or self._closed:
+                        continue
+                    rows = await self.db.claim_pending(self.library_id, self.backend, self.prefetch)
+                    for row in rows:
+                        item = {"Id": row["emby_id"], "Name": row["name"], "Path": row["path"]}
+                        heapq.heappush(self._heap, (row["priority"] or "", row["seq"] or 0, item["Id"], item))
+                    if not rows and generation == self._generation:
+                        self._maybe_more = False
+                continue
+            if self._scan_done:
+                return None
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return None
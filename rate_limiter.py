@@ -0,0 +1,358 @@
+import asyncio
+import datetime
+import email.utils
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` saved up."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds`, and drop any saved-up burst."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in FIFO order.
+        async with self._lock:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    self.updated = time.monotonic()
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+# AIMD tuning: additive step as a fraction of the configured rate, the floor
+# as a fraction of it, and how far above the latency average counts as "rising".
+AIMD_INCREASE_STEP = 0.1
+AIMD_MIN_RATE_FACTOR = 0.1
+AIMD_LATENCY_FACTOR = 3.0
+MAX_BACKOFF = 300.0
+
+
+class Backend:
+    """
+    A storage backend identified by a path prefix, with its own pacing.
+
+    With `adaptive` set the probe rate follows AIMD: each fast success adds a
+    small step, each 429/403 or latency spike multiplies it down. Hard
+    penalties also pause the bucket (Retry-After or exponential backoff).
+    The configured interval is a ceiling: only `max_speedup` above 1 lets
+    the rate climb past it.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        interval: float,
+        max_in_flight: int = 1,
+        adaptive: bool = False,
+        max_speedup: float = 1.0,
+        decrease_factor: float = 0.5,
+        start_rate: Optional[float] = None,
+    ):
+        self.prefix = prefix
+        self.interval = max(interval, 0.001)
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.adaptive = adaptive
+        self.decrease_factor = decrease_factor
+        self.base_rate = 1.0 / self.interval
+        self.min_rate = self.base_rate * AIMD_MIN_RATE_FACTOR
+        self.max_rate = self.base_rate * max(max_speedup, 1.0)
+        rate = self.base_rate
+        if adaptive and start_rate:
+            rate = min(max(start_rate, self.min_rate), self.max_rate)
+        self.bucket = TokenBucket(rate=rate)
+        # Shared by every job probing this backend, split by job weight
+        self.slots = WeightedSlots(self.max_in_flight)
+        self.latency_avg: Optional[float] = None
+        self.consecutive_penalties = 0
+
+    @property
+    def name(self) -> str:
+        return self.prefix or "default"
+
+    def reconfigure(
+        self,
+        interval: float,
+        max_in_flight: int = 1,
+        adaptive: bool = False,
+        max_speedup: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        """Apply new limits while probes are running; a learned rate is kept if it still fits."""
+        self.interval = max(interval, 0.001)
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.adaptive = adaptive
+        self.decrease_factor = decrease_factor
+        self.base_rate = 1.0 / self.interval
+        self.min_rate = self.base_rate * AIMD_MIN_RATE_FACTOR
+        self.max_rate = self.base_rate * max(max_speedup, 1.0)
+        if adaptive:
+            self.bucket.rate = min(max(self.bucket.rate, self.min_rate), self.max_rate)
+        else:
+            self.bucket.rate = self.base_rate
+        self.slots.resize(self.max_in_flight)
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    @asynccontextmanager
+    async def turn(self, shared: "WeightedSlots", key: str, weight: int = 1):
+        """
+        One probe's turn: this backend's in-flight slot, a slot of the shared
+        probe budget, then a token. The token comes last so the probe starts
+        right after it; a token taken while still queueing for a slot would
+        fire whenever that slot frees up, closer to the previous probe than
+        the interval allows.
+        """
+        async with self.slots.slot(key, weight), shared.slot(key, weight):
+            await self.bucket.acquire()
+            yield
+
+    def record_success(self, latency: float):
+        self.consecutive_penalties = 0
+        if self.adaptive:
+            if self.latency_avg is not None and latency > self.latency_avg * AIMD_LATENCY_FACTOR:
+                self._decrease()
+            else:
+                self.bucket.rate = min(self.bucket.rate + self.base_rate * AIMD_INCREASE_STEP, self.max_rate)
+        if self.latency_avg is None:
+            self.latency_avg = latency
+        else:
+            self.latency_avg = 0.8 * self.latency_avg + 0.2 * latency
+
+    def record_timeout(self):
+        """A probe ran past its deadline: slow down, without pausing the backend."""
+        if self.adaptive:
+            self._decrease()
+
+    def record_penalty(self, retry_after: Optional[float] = None) -> float:
+        """
+        Register a 429/403; returns how long the backend is paused for.
+        Responses that arrive while the backend is already paused were in
+        flight when the burst began, so they count as the same penalty.
+        """
+        remaining = self.bucket.paused_until - time.monotonic()
+        if remaining > 0:
+            if retry_after is not None and retry_after > remaining:
+                self.bucket.pause(retry_after)
+                return retry_after
+            return remaining
+        self.consecutive_penalties += 1
+        if self.adaptive:
+            self._decrease()
+        backoff = retry_after
+        if backoff is None:
+            backoff = min(self.interval * (2 ** self.consecutive_penalties), MAX_BACKOFF)
+        self.bucket.pause(backoff)
+        return backoff
+
+    def _decrease(self):
+        self.bucket.rate = max(self.bucket.rate * self.decrease_factor, self.min_rate)
+
+
+def parse_backend_limits(text: str) -> List[Tuple[str, float, int]]:
+    """
+    Parse `backend_limits` config lines of the form `<prefix> <interval> [max_in_flight]`,
+    e.g. `/mnt/user/115/ 5 1`. Invalid lines are logged and skipped.
+    """
+    rules = []
+    for line in (text or "").splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            prefix = parts[0]
+            interval = float(parts[1])
+            max_in_flight = int(parts[2]) if len(parts) > 2 else 1
+        except (IndexError, ValueError):
+            logger.warning(f"忽略无效的后端限速配置: {line!r}")
+            continue
+        rules.append((prefix, interval, max_in_flight))
+    return rules
+
+
+class BackendLimiter:
+    """Maps item paths to backends by longest matching prefix."""
+
+    def __init__(
+        self,
+        rules: List[Tuple[str, float, int]],
+        default_interval: float,
+        default_in_flight: int = 1,
+        learned_rates: Optional[Dict[str, float]] = None,
+        **backend_options,
+    ):
+        learned_rates = learned_rates or {}
+        self.backend_options = backend_options
+        self.backends = [
+            Backend(prefix, interval, n, start_rate=learned_rates.get(prefix), **backend_options)
+            for prefix, interval, n in rules
+        ]
+        # Longest prefix first so nested mounts win over their parents
+        self.backends.sort(key=lambda b: len(b.prefix), reverse=True)
+        self.default = Backend(
+            "", default_interval, default_in_flight, start_rate=learned_rates.get("default"), **backend_options
+        )
+
+    @staticmethod
+    def _options(config) -> Dict:
+        return {
+            "adaptive": config.adaptive_rate,
+            "max_speedup": config.aimd_max_speedup,
+            "decrease_factor": config.aimd_decrease_factor,
+        }
+
+    @classmethod
+    def from_config(cls, config, learned_rates: Optional[Dict[str, float]] = None) -> "BackendLimiter":
+        return cls(
+            parse_backend_limits(config.backend_limits),
+            config.scan_interval,
+            config.probe_workers,
+            learned_rates=learned_rates,
+            **cls._options(config),
+        )
+
+    def reconfigure(self, config):
+        """
+        Re-read the limits in place. Backends that are still configured keep
+        their bucket, slots and learned rate, so running workers pick up the
+        new pacing at their next probe; new prefixes apply to items matched
+        from now on.
+        """
+        self.backend_options = self._options(config)
+        existing = {backend.prefix: backend for backend in self.backends}
+        backends = []
+        for prefix, interval, n in parse_backend_limits(config.backend_limits):
+            backend = existing.get(prefix)
+            if backend is None:
+                backend = Backend(prefix, interval, n, **self.backend_options)
+            else:
+                backend.reconfigure(interval, n, **self.backend_options)
+            backends.append(backend)
+        backends.sort(key=lambda b: len(b.prefix), reverse=True)
+        self.backends = backends
+        self.default.reconfigure(config.scan_interval, config.probe_workers, **self.backend_options)
+
+    def all_backends(self) -> List[Backend]:
+        return self.backends + [self.default]
+
+    def match(self, path: str) -> Backend:
+        p_lower = (path or "").lower()
+        for backend in self.backends:
+            if p_lower.startswith(backend.prefix.lower()):
+                return backend
+        return self.default
+
+
+class WeightedSlots:
+    """
+    A global budget of concurrent probes shared by several jobs. When jobs
+    compete for a free slot it goes to the next job in smooth weighted
+    round-robin order, so a job with weight 2 gets twice the slots of a
+    job with weight 1.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self.in_use = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self.weights: Dict[str, int] = {}
+        self.current: Dict[str, float] = {}
+
+    async def acquire(self, key: str, weight: int = 1):
+        self.weights[key] = max(int(weight), 1)
+        if self.in_use < self.capacity and not any(self.waiters.values()):
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted right before the cancellation arrived: hand it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_use -= 1
+        self._grant()
+
+    def resize(self, capacity: int):
+        """Change the budget; slots above a lowered capacity drain as they are released."""
+        self.capacity = max(int(capacity), 1)
+        self._grant()
+
+    def forget(self, key: str):
+        """Drop a finished job's round-robin state."""
+        self.waiters.pop(key, None)
+        self.weights.pop(key, None)
+        self.current.pop(key, None)
+
+    def _grant(self):
+        while self.in_use < self.capacity:
+            keys = [k for k, q in self.waiters.items() if q]
+            if not keys:
+                return
+            total = sum(self.weights[k] for k in keys)
+            for k in keys:
+                self.current[k] = self.current.get(k, 0) + self.weights[k]
+            best = max(keys, key=lambda k: self.current[k])
+            self.current[best] -= total
+            future = self.waiters[best].popleft()
+            if future.cancelled():
+                continue
+            self.in_use += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: str, weight: int = 1):
+        await self.acquire(key, weight)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import logging
+from typing import List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CronExpression:
+    """
+    Minimal five-field cron expression: minute hour day-of-month month
+    day-of-week. Each field accepts *, numbers, ranges (a-b), lists (a,b)
+    and steps (*/n, a-b/n). Day-of-week is 0-6 with 0 (or 7) = Sunday.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.fields = [self._parse(part, lo, hi) for part, (lo, hi) in zip(parts, self.RANGES)]
+        if 7 in self.fields[4]:
+            self.fields[4].add(0)
+        # Standard cron: when both day fields are restricted, either may match
+        self.dom_any = parts[2] == "*"
+        self.dow_any = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, lo: int, hi: int) -> Set[int]:
+        values = set()
+        for chunk in part.split(","):
+            step = 1
+            if "/" in chunk:
+                chunk, step_str = chunk.split("/", 1)
+                step = int(step_str)
+                if step < 1:
+                    raise ValueError(f"invalid step in {part!r}")
+            if chunk == "*":
+                start, end = lo, hi
+            elif "-" in chunk:
+                start_str, end_str = chunk.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(chunk)
+                end = hi if step > 1 else start
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"value out of range in {part!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, when: datetime.datetime) -> bool:
+        minute, hour, dom, month, dow = self.fields
+        if when.minute not in minute or when.hour not in hour or when.month not in month:
+            return False
+        dom_ok = when.day in dom
+        dow_ok = (when.weekday() + 1) % 7 in dow
+        if self.dom_any or self.dow_any:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok
+
+
+def parse_schedules(text: str) -> List[Tuple[CronExpression, str, bool]]:
+    """
+    Parse `schedules` config lines: `<cron> <library_id|all> [force]`,
+    e.g. `30 3 * * * all` or `0 */6 * * 1-5 abc123 force`.
+    Invalid lines are logged and skipped.
+    """
+    schedules = []
+    for line in (text or "").splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            if len(parts) < 6:
+                raise ValueError("missing library")
+            cron = CronExpression(" ".join(parts[:5]))
+            force = len(parts) > 6 and parts[6].lower() == "force"
+            schedules.append((cron, parts[5], force))
+        except ValueError as e:
+            logger.warning(f"忽略无效的定时任务配置: {line!r} ({e})")
+    return schedules
+
+
+async def run_schedules(task_manager, load_config):
+    """Background loop: once a minute, enqueue the jobs whose schedule matches."""
+    while True:
+        now = datetime.datetime.now()
+        # Sleep to the start of the next minute
+        await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000)
+        now = datetime.datetime.now().replace(second=0, microsecond=0)
+        for cron, target, force in parse_schedules(load_config().schedules):
+            if not cron.matches(now):
+                continue
+            logger.info(f"定时任务触发: {cron.expr} -> {target}")
+            try:
+                if target.lower() == "all":
+                    await task_manager.enqueue_all(force)
+                else:
+                    await task_manager.enqueue([target], force)
+            except Exception as e:
+                logger.error(f"定时任务启动失败 ({cron.expr} -> {target}): {e}")
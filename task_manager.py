@@ -1,283 +1,1109 @@
 import asyncio
+import json
 import logging
 import time
-from typing import List, Optional, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from fastapi import WebSocket
 import httpx
 from collections import deque
 import traceback
 import datetime
-from emby_client import EmbyClient
-from config import load_config
-from database import Database
+from emby_client import FINGERPRINT_FIELDS, get_emby_client, item_fingerprint
+from config import load_config, subscribe, AppConfig
+from database import MAX_RETRIES, AsyncDatabase, BufferedStatusWriter
+from rate_limiter import BackendLimiter, WeightedSlots, parse_retry_after
+from verifier import BatchVerifier
+from path_rules import PathRules
+from link_checker import StrmPrecheck
+from probe_queue import ProbePriority, ProbeQueue
+from metrics import (
+    ITEMS_FAILED, ITEMS_IGNORED, ITEMS_PROBED, ITEMS_SCANNED, ITEMS_SUCCEEDED, PROBE_TIMEOUTS, PROBES_IN_FLIGHT,
+    QUEUE_DEPTH, RATE_LIMIT_HITS, REFRESH_LATENCY, VERIFY_LATENCY,
+)
 
 logger = logging.getLogger(__name__)
 
+# Seconds Stop waits for a run to wind down (in-flight probes are cancelled
+# right away) before cancelling the run itself, e.g. mid page fetch.
+STOP_GRACE = 5.0
+
+class _Viewer:
+    """One WebSocket client: a bounded outbox drained by its own sender task."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.outbox: deque = deque(maxlen=queue_size)
+        self.dropped = 0
+        self.wakeup = asyncio.Event()
+        self.sender: Optional[asyncio.Task] = None
+
+    def push(self, entry):
+        if len(self.outbox) == self.outbox.maxlen:
+            self.dropped += 1  # drop-oldest: the deque discards the head
+        self.outbox.append(entry)
+        self.wakeup.set()
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Fans log lines out to WebSocket viewers without ever blocking the caller.
+
+    `broadcast` only appends to the replay buffer and to each viewer's
+    bounded outbox; a per-viewer sender task coalesces whatever arrived in
+    the last `batch_interval` seconds into one JSON frame
+    `{"epoch", "seq", "lines"}`. A viewer that falls behind loses its oldest
+    lines, one that stalls past `send_timeout` is dropped. Reconnecting
+    clients pass the last `seq` they saw (and the server `epoch`) and only
+    get the lines they missed.
+    """
+
+    def __init__(self, buffer_size: int = 2000, queue_size: int = 1000,
+                 batch_interval: float = 0.2, send_timeout: float = 10.0):
+        self.viewers: Dict[WebSocket, _Viewer] = {}
+        self.log_buffer = deque(maxlen=buffer_size)  # (seq, message)
+        self.seq = 0
+        self.epoch = str(int(time.time() * 1000))
+        self.queue_size = queue_size
+        self.batch_interval = batch_interval
+        self.send_timeout = send_timeout
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.viewers)
+
+    async def connect(self, websocket: WebSocket, since: int = 0, epoch: Optional[str] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        # Send buffered logs to new connections
-        try:
-            from task_manager import task_manager  # local import to avoid circular
-            for msg in task_manager.log_buffer:
-                try:
-                    await websocket.send_text(msg)
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # History from a previous server process does not line up with ours
+        if epoch != self.epoch:
+            since = 0
+        history = [entry for entry in self.log_buffer if entry[0] > since]
+        # The outbox holds the whole replay, so reconnecting loses nothing
+        viewer = _Viewer(websocket, max(self.queue_size, len(history)))
+        for entry in history:
+            viewer.push(entry)
+        viewer.sender = asyncio.create_task(self._sender(viewer))
+        self.viewers[websocket] = viewer
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        viewer = self.viewers.pop(websocket, None)
+        if viewer is not None and viewer.sender is not None:
+            viewer.sender.cancel()
 
     async def broadcast(self, message: str):
-        # Append to buffer
+        self.seq += 1
+        entry = (self.seq, message)
+        self.log_buffer.append(entry)
+        for viewer in self.viewers.values():
+            viewer.push(entry)
+
+    async def _sender(self, viewer: _Viewer):
         try:
-            from task_manager import task_manager  # local import to avoid circular
-            task_manager.log_buffer.append(message)
+            while True:
+                await viewer.wakeup.wait()
+                # Let a burst accumulate so it goes out as one frame
+                await asyncio.sleep(self.batch_interval)
+                viewer.wakeup.clear()
+                entries = list(viewer.outbox)
+                viewer.outbox.clear()
+                if not entries:
+                    continue
+                lines = [message for _, message in entries]
+                if viewer.dropped:
+                    lines.insert(0, f"[系统] 日志输出过快，已省略 {viewer.dropped} 条")
+                    viewer.dropped = 0
+                frame = json.dumps({"epoch": self.epoch, "seq": entries[-1][0], "lines": lines}, ensure_ascii=False)
+                await asyncio.wait_for(viewer.websocket.send_text(frame), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
         except Exception:
-            pass
-        for connection in self.active_connections:
+            # Dead or stalled socket: prune it
+            self.viewers.pop(viewer.websocket, None)
             try:
-                await connection.send_text(message)
+                await viewer.websocket.close()
             except Exception:
                 pass
 
 manager = ConnectionManager()
 
+class Job:
+    """
+    One library run: its options, progress and stop flags. An `events_only`
+    job does not enumerate the library; it only probes items handed in
+    through `inject` (webhook notifications).
+    """
+
+    def __init__(
+        self,
+        library_id: str,
+        force: bool = False,
+        name: Optional[str] = None,
+        weight: int = 1,
+        events_only: bool = False,
+    ):
+        self.library_id = library_id
+        self.name = name or library_id
+        self.force = force
+        self.weight = weight
+        self.events_only = events_only
+        self.state = "queued"  # queued -> running -> done / stopped / failed / cancelled
+        self.should_stop = False
+        # Stopped by a server shutdown: the next start resumes the run
+        self.resume_on_start = False
+        self.rate_limited = False
+        self.stats = {"scanned": 0, "total": 0, "processed": 0, "success": 0}
+        self.dequeued = 0  # items handed to probe workers, for [n/total] numbering
+        self.verify_tasks: Set[asyncio.Task] = set()
+        self.probes: Set[asyncio.Task] = set()  # probe requests in flight
+        self.queues: Dict = {}  # backend -> probe queue, while running
+        # Set while running: applies a changed config to the run in place
+        self.apply_config: Optional[Callable[[AppConfig], None]] = None
+        self.path_rules: Optional[PathRules] = None
+        # Items from webhook notifications, waiting to be queued by the run
+        self.injected: List[Dict] = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.queued_at = datetime.datetime.utcnow().isoformat() + "Z"
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    @property
+    def held_state(self) -> str:
+        """Checkpoint state for a run that stops unfinished."""
+        return "running" if self.resume_on_start else "paused"
+
+    def stop(self, resume: bool = False):
+        """Ask the run to stop and abandon its in-flight probes."""
+        self.should_stop = True
+        self.resume_on_start = resume
+        for probe in list(self.probes):
+            probe.cancel()
+
+    def inject(self, items: List[Dict]):
+        self.injected.extend(items)
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def log(self, message: str):
+        # Several libraries may run at once, so every line names its library
+        if message.lstrip().startswith("<"):
+            await manager.broadcast(message)
+        else:
+            await manager.broadcast(f"[{self.name}] {message}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "library_id": self.library_id,
+            "name": self.name,
+            "state": self.state,
+            "force": self.force,
+            "weight": self.weight,
+            "events_only": self.events_only,
+            "statistics": dict(self.stats),
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def parse_library_weights(text: str) -> Dict[str, int]:
+    """`library_weights` lines: `<library_id> <weight>`; invalid lines are skipped."""
+    weights = {}
+    for line in (text or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            weights[parts[0]] = max(int(parts[1]), 1)
+    return weights
+
+
 class TaskManager:
+    """
+    Job scheduler for library runs. Queued jobs start as soon as fewer than
+    `max_concurrent_jobs` are running. Running jobs share one BackendLimiter
+    (so two libraries on the same drive respect one rate limit) and one
+    global probe budget, split between them by weighted round-robin.
+    """
+
     def __init__(self):
-        self.is_running = False
-        self.should_stop = False
-        self.current_task: Optional[asyncio.Task] = None
-        self.current_library_id: Optional[str] = None
-        self.stats = {"total": 0, "processed": 0, "success": 0}
-        self.log_buffer = deque(maxlen=2000)
-        self.db = Database()
+        self.jobs: Dict[str, Job] = {}
+        self.pending: deque = deque()
+        self.log_buffer = manager.log_buffer
+        self.db = AsyncDatabase()
+        self.limiter: Optional[BackendLimiter] = None
+        self.probe_slots: Optional[WeightedSlots] = None
+        self._shared_config: Optional[AppConfig] = None
+        self._shared_lock: Optional[asyncio.Lock] = None
+        self.closing = False
+        QUEUE_DEPTH.collector = self._queue_depths
+        subscribe(self._apply_config)
+
+    @property
+    def running_jobs(self) -> List[Job]:
+        return [job for job in self.jobs.values() if job.state == "running"]
+
+    @property
+    def is_running(self) -> bool:
+        return any(job.active for job in self.jobs.values())
+
+    @property
+    def current_library_id(self) -> Optional[str]:
+        running = self.running_jobs
+        return running[0].library_id if running else None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Progress summed over active jobs."""
+        totals = {"scanned": 0, "total": 0, "processed": 0, "success": 0}
+        for job in self.jobs.values():
+            if job.active:
+                for key in totals:
+                    totals[key] += job.stats.get(key, 0)
+        return totals
+
+    def get_jobs(self) -> List[Dict]:
+        return [job.to_dict() for job in self.jobs.values()]
 
     async def start_task(self, library_id: str, force: bool = False):
-        if self.is_running:
+        return await self.enqueue([library_id], force)
+
+    async def enqueue(self, library_ids: List[str], force: bool = False, names: Optional[Dict[str, str]] = None):
+        config = load_config()
+        if names is None:
+            names = await self._library_names(config)
+        weights = parse_library_weights(config.library_weights)
+        added = []
+        for library_id in library_ids:
+            existing = self.jobs.get(library_id)
+            if existing and existing.state == "queued" and existing.events_only:
+                # A full run covers the webhook items too
+                existing.events_only = False
+                existing.force = existing.force or force
+                added.append(existing)
+                continue
+            if existing and existing.active:
+                continue
+            job = Job(library_id, force, names.get(library_id), weights.get(library_id, 1))
+            self.jobs[library_id] = job
+            self.pending.append(job)
+            added.append(job)
+        if not added:
             return False, "Task already running"
-        
-        self.should_stop = False
-        self.is_running = True
-        self.current_library_id = library_id
-        self.stats = {"total": 0, "processed": 0, "success": 0}
-        self.current_task = asyncio.create_task(self._process_library(library_id, force))
-        return True, "Task started"
-
-    async def stop_task(self):
-        if not self.is_running:
+        self._launch(config)
+        return True, f"{len(added)} task(s) queued"
+
+    async def enqueue_all(self, force: bool = False):
+        config = load_config()
+        libraries = await get_emby_client(config).get_libraries()
+        names = {lib["Id"]: lib.get("Name", lib["Id"]) for lib in libraries if lib.get("Id")}
+        return await self.enqueue(list(names), force, names)
+
+    async def enqueue_items(self, library_id: str, items: List[Dict], name: Optional[str] = None):
+        """
+        Queue items announced by a webhook: into the library's active job if
+        there is one, else into a new job that processes only these items.
+        """
+        job = self.jobs.get(library_id)
+        if job is not None and job.active:
+            job.inject(items)
+            return
+        config = load_config()
+        weights = parse_library_weights(config.library_weights)
+        job = Job(library_id, name=name, weight=weights.get(library_id, 1), events_only=True)
+        job.inject(items)
+        self.jobs[library_id] = job
+        self.pending.append(job)
+        self._launch(config)
+
+    async def submit_new_items(self, item_ids: List[str]):
+        """Webhook intake handler: one batched lookup per 100 items, then queue them per library."""
+        config = load_config()
+        client = get_emby_client(config)
+        priority = ProbePriority.from_config(config)
+        # Library folders, longest first, to find the library an item lives in
+        locations = sorted(
+            (
+                (location.rstrip("/\\").lower(), folder["ItemId"], folder.get("Name"))
+                for folder in await client.get_virtual_folders() if folder.get("ItemId")
+                for location in folder.get("Locations") or []
+            ),
+            key=lambda entry: len(entry[0]),
+            reverse=True,
+        )
+        by_library: Dict[str, List[Dict]] = {}
+        names: Dict[str, str] = {}
+        unmatched = 0
+        for i in range(0, len(item_ids), 100):
+            items = await client.get_items_by_ids(
+                item_ids[i : i + 100], ",".join(filter(None, [FINGERPRINT_FIELDS, priority.fields])), priority.user_data
+            )
+            for item in items:
+                path = (item.get("Path") or "").lower()
+                if not path.endswith(".strm"):
+                    continue
+                match = next(
+                    (entry for entry in locations if path.startswith((entry[0] + "/", entry[0] + "\\"))), None
+                )
+                if match is None:
+                    unmatched += 1
+                    continue
+                by_library.setdefault(match[1], []).append(item)
+                names[match[1]] = match[2]
+        queued = sum(len(items) for items in by_library.values())
+        await manager.broadcast(
+            f"[Webhook] 收到 {len(item_ids)} 个新项目，{queued} 个 .strm 文件加入探测队列"
+            + (f"，{unmatched} 个不属于任何媒体库" if unmatched else "")
+        )
+        for library_id, items in by_library.items():
+            await self.enqueue_items(library_id, items, names.get(library_id))
+
+    async def stop_task(self, library_id: Optional[str] = None, resume: bool = False):
+        targets = [
+            job for job in self.jobs.values()
+            if job.active and (library_id is None or job.library_id == library_id)
+        ]
+        if not targets:
             return False, "No task running"
-        
-        self.should_stop = True
-        if self.current_task:
-            await self.current_task
+        for job in targets:
+            job.stop(resume)
+            if job.state == "queued":
+                self.pending.remove(job)
+                job.state = "cancelled"
+        tasks = [job.task for job in targets if job.task]
+        if tasks:
+            _, slow = await asyncio.wait(tasks, timeout=STOP_GRACE)
+            for task in slow:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
         return True, "Task stopped"
 
-    async def _process_library(self, library_id: str, force: bool):
-        config = load_config()
-        client = EmbyClient(config.emby_host, config.api_key, config.user_id)
-        exclude_lines = [l.strip() for l in (config.exclude_paths or "").splitlines() if l.strip()]
-        
+    async def shutdown(self):
+        """
+        Stop every job before the server exits. Their checkpoints stay
+        "running", so the next start resumes them; abandoned probes are
+        never recorded as failures.
+        """
+        self.closing = True
+        await self.stop_task(resume=True)
+
+    async def _library_names(self, config: AppConfig) -> Dict[str, str]:
+        try:
+            libraries = await get_emby_client(config).get_libraries()
+        except Exception:
+            return {}
+        return {lib["Id"]: lib.get("Name", lib["Id"]) for lib in libraries if lib.get("Id")}
+
+    def _launch(self, config: AppConfig):
+        if self.closing:
+            return
+        limit = max(config.max_concurrent_jobs, 1)
+        while self.pending and len(self.running_jobs) < limit:
+            job = self.pending.popleft()
+            job.state = "running"
+            job.started_at = datetime.datetime.utcnow().isoformat() + "Z"
+            job.task = asyncio.create_task(self._run_job(job))
+
+    async def _run_job(self, job: Job):
+        try:
+            config, limiter = await self._acquire_shared()
+            await self._process_library(job, config, limiter)
+        finally:
+            if job.state == "running":
+                job.state = "stopped" if (job.should_stop or job.rate_limited) else "done"
+            job.finished_at = datetime.datetime.utcnow().isoformat() + "Z"
+            job.apply_config = None
+            if self.probe_slots is not None:
+                self.probe_slots.forget(job.library_id)
+            if self.limiter is not None:
+                for backend in self.limiter.all_backends():
+                    backend.slots.forget(job.library_id)
+            if not self.running_jobs:
+                await self._release_shared()
+            # Notifications that arrived after the run stopped taking them
+            leftover, job.injected = job.injected, []
+            if leftover and not job.should_stop:
+                await self.enqueue_items(job.library_id, leftover, job.name)
+            self._launch(load_config())
+
+    async def _acquire_shared(self):
+        """Limiter and probe budget shared by all running jobs, built by the first."""
+        if self._shared_lock is None:
+            # Created lazily so it belongs to the server's event loop
+            self._shared_lock = asyncio.Lock()
+        async with self._shared_lock:
+            if self.limiter is None:
+                config = load_config()
+                self.limiter = BackendLimiter.from_config(config, await self._load_learned_rates())
+                self.probe_slots = WeightedSlots(config.probe_workers)
+                self._shared_config = config
+            return self._shared_config, self.limiter
+
+    async def _release_shared(self):
+        async with self._shared_lock:
+            if self.limiter is not None and self._shared_config.adaptive_rate:
+                await self._save_learned_rates(self.limiter.all_backends())
+            self.limiter = None
+            self.probe_slots = None
+            self._shared_config = None
+
+    def _apply_config(self, config: AppConfig):
+        """Config subscriber: retune running jobs without restarting them."""
+        self._launch(config)
+        if self.limiter is None:
+            return
+        self._shared_config = config
+        self.limiter.reconfigure(config)
+        self.probe_slots.resize(config.probe_workers)
+        for job in self.running_jobs:
+            if job.apply_config is not None:
+                job.apply_config(config)
+                asyncio.get_running_loop().create_task(job.log("[系统] 配置已更新，已应用到运行中的任务"))
+
+    async def _process_library(self, job: "Job", config: AppConfig, limiter: BackendLimiter):
+        library_id = job.library_id
+        force = job.force
+        client = get_emby_client(config)
+        path_rules = job.path_rules = PathRules.from_config(config)
+
         try:
             # 1. Identity Pre-check
-            await manager.broadcast("[系统] 正在验证身份...")
+            await job.log("[系统] 正在验证身份...")
             try:
                 user_info = await client.get_user_info()
                 user_name = user_info.get("Name", "Unknown")
                 user_id_check = user_info.get("Id", "Unknown")
-                await manager.broadcast(f"[系统] 身份确认: 当前操作用户为 <strong>{user_name}</strong> (ID: {user_id_check})")
+                await job.log(f"[系统] 身份确认: 当前操作用户为 <strong>{user_name}</strong> (ID: {user_id_check})")
             except httpx.HTTPStatusError as e:
                 error_body = e.response.text
-                await manager.broadcast(f"[系统] 身份验证失败: HTTP {e.response.status_code}")
-                await manager.broadcast(f"<pre class='text-xs bg-gray-800 p-2 rounded mt-1'>{error_body}</pre>")
+                await job.log(f"[系统] 身份验证失败: HTTP {e.response.status_code}")
+                await job.log(f"<pre class='text-xs bg-gray-800 p-2 rounded mt-1'>{error_body}</pre>")
+                job.state = "failed"
                 return
             except Exception as e:
-                await manager.broadcast(f"[系统] 身份验证异常: {str(e)}")
+                await job.log(f"[系统] 身份验证异常: {str(e)}")
+                job.state = "failed"
                 return
-            last_sync = self.db.get_config("last_sync_time")
-            full_mode = force or (not last_sync)
-            if full_mode:
-                await manager.broadcast("[系统] 全量扫描模式")
+            # 2. Resume an unfinished run from its checkpoint, or start a new
+            # one against this library's own watermark. Webhook-only runs
+            # leave the checkpoint and watermark alone.
+            checkpoint = None if (force or job.events_only) else await self.db.get_checkpoint(library_id)
+            if job.events_only:
+                full_mode = False
+                since = run_started = None
+                start_index = 0
+                resumed = 0
+                # A paused run's queue is not ours to probe
+                await self.db.hold_pending(library_id)
+            elif checkpoint:
+                full_mode = bool(checkpoint["full_mode"])
+                since = checkpoint["since"]
+                run_started = checkpoint["started_at"]
+                # The cursor is an offset into get_items' stable order
+                # (LIST_SORT_BY), so new items do not shift it
+                start_index = checkpoint["cursor"] or 0
+                # Held back until re-checked and re-queued below
+                await self.db.hold_pending(library_id)
+                resumed = await self.db.count_pending(library_id)
+                job.stats["scanned"] = start_index
+                await self.db.set_checkpoint_state(library_id, "running")
+                await job.log(
+                    f"[系统] 从断点恢复: 跳过已扫描的 {start_index} 个项目，{resumed} 个未完成项目重新入队"
+                )
+            else:
+                since = await self.db.get_config(f"last_sync_time:{library_id}")
+                full_mode = force or (not since)
+                if full_mode:
+                    since = None
+                # The watermark is the run's start, so items saved while it runs are seen next time
+                run_started = datetime.datetime.utcnow().isoformat() + "Z"
+                start_index = 0
+                resumed = 0
+                if full_mode:
+                    await self.db.begin_seen_ids(library_id)
+                await self.db.begin_checkpoint(library_id, full_mode, since, run_started)
+            if job.events_only:
+                await job.log(f"[Webhook] 处理 {len(job.injected)} 个新项目")
+            elif full_mode:
+                await job.log("[系统] 全量扫描模式")
             else:
-                await manager.broadcast(f"[系统] 增量同步模式: 起始时间 {last_sync}")
-            scanned_ids: Set[str] = set()
-            pending_items = []
+                await job.log(f"[系统] 增量同步模式: 起始时间 {since}")
             skipped_count = 0
-            total_found = 0
+            dead_count = 0
             loaded_count = 0
             last_reported = 0
             limit_reached = False
-            async for batch in client.get_items(library_id, None if full_mode else last_sync):
-                total_found += len(batch)
-                loaded_count += len(batch)
-                if loaded_count - last_reported >= 1000:
-                    await manager.broadcast(f"[扫描] 已加载 {loaded_count} 个项目...")
-                    last_reported = loaded_count
+            exhausted = False
+            # Scan-phase "ignored" rows are written in one transaction per page
+            status_writer = BufferedStatusWriter(self.db)
+
+            # Scan and probe run as a pipeline: the scanner below writes each
+            # page into the checkpoint, and per-backend workers claim from it
+            # in priority order, so the first probe starts with the first page,
+            # memory stays flat and the best items go first whenever they show up.
+            queues = job.queues
+            workers: List[asyncio.Task] = []
+            worker_counts: Dict = {}
+            priority = ProbePriority.from_config(config)
+            # Item fields every page and lookup asks for: fingerprint and priority inputs
+            item_fields = ",".join(filter(None, [FINGERPRINT_FIELDS, priority.fields]))
+            queued_seq = 0
+            verifier = BatchVerifier(
+                client, initial_delay=config.verify_initial_delay, timeout=config.verify_timeout
+            )
+            precheck = StrmPrecheck.from_config(config) if config.strm_precheck else None
+
+            async def select_candidates(batch) -> List[Tuple[Dict, str]]:
+                """Items of `batch` that need a probe, with their priority keys."""
+                nonlocal skipped_count, dead_count
+                # One status lookup per page instead of one per candidate
+                known_status = await self.db.get_media_statuses([
+                    item["Id"] for item in batch
+                    if item.get("Id") and (item.get("Path") or "").lower().endswith(".strm")
+                ])
+                candidates = []
+                unchanged = 0
+                now = time.time()
                 for item in batch:
                     path = item.get("Path", "") or ""
-                    name = item.get("Name", "Unknown")
-                    item_id = item.get("Id")
-                    media_streams = item.get("MediaStreams", [])
-                    if full_mode and item_id:
-                        scanned_ids.add(item_id)
                     p_lower = path.lower()
                     if not p_lower.endswith(".strm"):
                         continue
-                    if any(excl in p_lower for excl in exclude_lines):
-                        await manager.broadcast(f"[跳过] 黑名单: {name} -> {path}")
+                    name = item.get("Name", "Unknown")
+                    item_id = item.get("Id")
+                    media_streams = item.get("MediaStreams", [])
+                    status_row = known_status.get(item_id)
+                    fingerprint = item_fingerprint(item)
+                    if status_row and status_row.get("fingerprint") == fingerprint:
+                        # Ignored last time and unchanged since: no decision and no
+                        # write, unless the path rule that ignored it is gone.
+                        if media_streams or path_rules.check(path) is not None:
+                            unchanged += 1
+                            continue
+                    if path_rules.check(path) is not None:
+                        logger.info(f"[跳过] 黑名单: {name} -> {path}")
+                        ITEMS_IGNORED.inc(library=library_id, reason="path_rule")
                         if item_id:
-                            self.db.set_media_status(item_id, name, path, "ignored")
+                            await status_writer.add(
+                                item_id, name, path, "ignored", library_id=library_id, fingerprint=fingerprint
+                            )
                         continue
                     if media_streams and len(media_streams) > 0:
                         skipped_count += 1
                         logger.info(f"[跳过] {name} 已包含元数据")
+                        ITEMS_IGNORED.inc(library=library_id, reason="has_streams")
                         if item_id:
-                            self.db.set_media_status(item_id, name, path, "ignored")
+                            await status_writer.add(
+                                item_id, name, path, "ignored", library_id=library_id, fingerprint=fingerprint
+                            )
                         continue
                     # DB checks
-                    status_row = self.db.get_media_status(item_id) if item_id else None
                     if status_row and status_row.get("status") == "success":
                         continue
-                    if status_row and status_row.get("status") == "failed" and int(status_row.get("retry_count") or 0) >= 3 and (not force):
-                        continue
-                    pending_items.append(item)
-                    if config.batch_size > 0 and len(pending_items) >= config.batch_size:
-                        limit_reached = True
+                    if status_row and status_row.get("status") in ("failed", "timeout") and not force:
+                        # Failed items wait out their backoff, and are given up on eventually
+                        if int(status_row.get("retry_count") or 0) >= MAX_RETRIES:
+                            continue
+                        due_at = status_row.get("next_retry_at")
+                        if due_at is not None and due_at > now:
+                            continue
+                    candidates.append((item, priority.key(item, status_row)))
+                if unchanged:
+                    skipped_count += unchanged
+                    ITEMS_IGNORED.inc(unchanged, library=library_id, reason="unchanged")
+                if precheck is not None and candidates:
+                    # Dead .strm targets are failed here, without an Emby round trip
+                    dead = await precheck.find_dead([item for item, _ in candidates])
+                    for item, _ in candidates:
+                        reason = dead.get(item["Id"])
+                        if reason is None:
+                            continue
+                        name = item.get("Name", "Unknown")
+                        await job.log(f"[预检] 失败: {name} - 链接失效 ({reason})")
+                        await status_writer.add(
+                            item["Id"], name, item.get("Path", ""), "failed", f"链接失效: {reason}", True, library_id
+                        )
+                        ITEMS_FAILED.inc(backend=limiter.match(item.get("Path", "")).name)
+                    dead_count += len(dead)
+                    candidates = [c for c in candidates if c[0]["Id"] not in dead]
+                await status_writer.flush()
+                return candidates
+
+            def add_workers(backend, queue: ProbeQueue):
+                # One worker per in-flight slot; a lowered limit just leaves some waiting
+                while worker_counts.get(backend, 0) < backend.max_in_flight:
+                    worker_counts[backend] = worker_counts.get(backend, 0) + 1
+                    workers.append(asyncio.create_task(
+                        self._probe_worker(job, client, backend, queue, verifier)
+                    ))
+
+            async def queue_for(backend) -> ProbeQueue:
+                queue = queues.get(backend)
+                if queue is None:
+                    queue = queues[backend] = ProbeQueue(self.db, library_id, backend.name, config.probe_prefetch)
+                    await job.log(
+                        f"[调度] 后端 {backend.name}: 间隔 {1 / backend.rate:.2f}s，并发 {backend.max_in_flight}"
+                    )
+                    add_workers(backend, queue)
+                return queue
+
+            def apply_config(new_config: AppConfig):
+                # New intervals and slot limits already live in the shared
+                # limiter; what is left is this run's own view of the config.
+                nonlocal config, path_rules
+                config = new_config
+                hits = path_rules.hits
+                path_rules = job.path_rules = PathRules.from_config(new_config)
+                path_rules.hits = hits
+                for backend, queue in queues.items():
+                    queue.prefetch = max(new_config.probe_prefetch, 1)
+                    add_workers(backend, queue)
+
+            job.apply_config = apply_config
+
+            fed: Set[str] = set()
+            feeding_done = False
+
+            async def feed_injected():
+                """Queue the items webhook notifications handed to this run."""
+                while job.injected and not (job.should_stop or job.rate_limited):
+                    batch = [item for item in job.injected[:100] if item.get("Id") and item["Id"] not in fed]
+                    del job.injected[:100]
+                    fed.update(item["Id"] for item in batch)
+                    if job.events_only:
+                        job.stats["scanned"] += len(batch)
+                    await dispatch_all(await select_candidates(batch), None)
+
+            async def feeder():
+                while True:
+                    job.wakeup.clear()
+                    await feed_injected()
+                    if feeding_done or job.should_stop or job.rate_limited:
+                        return
+                    await job.wakeup.wait()
+
+            job.wakeup = asyncio.Event()
+            feeder_task = asyncio.create_task(feeder())
+
+            async def dispatch_all(candidates, cursor: Optional[int], requeue: bool = False) -> bool:
+                """
+                Queue candidates in the checkpoint, together with the cursor
+                past their page. Past the batch limit they are written as
+                already claimed: this run skips them, the next one resumes them.
+                """
+                nonlocal limit_reached, queued_seq
+                budget = len(candidates)
+                if config.batch_size > 0:
+                    budget = max(min(budget, config.batch_size - job.stats["total"]), 0)
+                rows = []
+                backends: Dict = {}
+                for i, (item, key) in enumerate(candidates):
+                    backend = limiter.match(item.get("Path", ""))
+                    backends[backend.name] = backend
+                    rows.append((
+                        item["Id"], item.get("Name", "Unknown"), item.get("Path", ""), backend.name,
+                        key, queued_seq, int(i >= budget),
+                    ))
+                    queued_seq += 1
+                added = await self.db.checkpoint_page(library_id, cursor, rows, requeue)
+                for backend_name, count in added.items():
+                    (await queue_for(backends[backend_name])).added(count)
+                    job.stats["total"] += count
+                if budget < len(candidates) or (config.batch_size > 0 and job.stats["total"] >= config.batch_size):
+                    limit_reached = True
+                    return False
+                return True
+
+            async def retry_pass() -> bool:
+                """Re-queue this library's failed items whose backoff has expired, in due order."""
+                now = time.time()
+                after = None
+                retried = 0
+                while not (job.should_stop or job.rate_limited):
+                    due = await self.db.get_due_retries(library_id, now, after)
+                    if not due:
                         break
-                if limit_reached:
-                    break
-            pending_total = len(pending_items)
-            total_strm_todo = pending_total
-            self.stats["total"] = total_strm_todo
-            await manager.broadcast(f"扫描完成: 共发现 {total_found} 个项目。")
-            await manager.broadcast(f"智能过滤: {skipped_count} 个 .strm 文件已有媒体信息或被黑名单忽略。")
-            await manager.broadcast(f"待修复队列: {total_strm_todo} 个文件。")
-            if total_strm_todo == 0:
-                await manager.broadcast("所有 .strm 文件均正常或已忽略，任务结束。")
-                if full_mode:
-                    db_ids = set(self.db.get_all_ids())
-                    missing = list(db_ids - scanned_ids)
-                    removed = self.db.delete_ids(missing)
-                    await manager.broadcast(f"[清理] 发现 {removed} 个已删除项目，已从数据库移除")
-                self.db.set_config("last_sync_time", datetime.datetime.utcnow().isoformat() + "Z")
-                return
+                    after = (due[-1]["next_retry_at"], due[-1]["emby_id"])
+                    candidates = await select_candidates(await client.get_items_by_ids(
+                        [row["emby_id"] for row in due], item_fields, priority.user_data
+                    ))
+                    retried += len(candidates)
+                    if not await dispatch_all(candidates, start_index + loaded_count):
+                        return False
+                if retried:
+                    await job.log(f"[重试] {retried} 个失败项目已到重试时间，重新加入队列")
+                return not (job.should_stop or job.rate_limited)
 
-            # Apply batch size limit
-            batch_size = config.batch_size
-            items = pending_items
-            limited = limit_reached
-            if limited:
-                await manager.broadcast(f"配置限制: 达到批量上限，仅处理前 {len(items)} 个文件。")
-
-            await manager.broadcast("准备开始修复任务...")
-
-            processed_local = 0
-            for index, item in enumerate(items):
-                if self.should_stop:
-                    await manager.broadcast("[系统] 用户已手动终止任务")
-                    break
-
-                name = item.get('Name', 'Unknown')
-                item_id = item.get('Id')
-                logger.info(f"[探测] 正在处理: {name} (ID: {item_id})...")
-                
-                await manager.broadcast(f"[{index + 1}/{total_strm_todo}] 正在探测: {name}...")
-                
-                try:
-                    # 1. Low Bitrate Trick (Force Probe)
-                    await client.refresh_item(item_id)
-                    
-                    # 2. Post-Check Verification (Wait & Verify)
-                    # Wait for Emby to process the probe result (DB write)
-                    await asyncio.sleep(2) 
-                    
-                    updated_item = await client.get_item_details(item_id)
-                    media_streams = updated_item.get('MediaStreams', [])
-                    
-                    if media_streams and len(media_streams) > 0:
-                        # Extract rich info for logging
-                        video_stream = next((s for s in media_streams if s.get('Type') == 'Video'), {})
-                        width = video_stream.get('Width')
-                        height = video_stream.get('Height')
-                        codec = video_stream.get('Codec', 'Unknown').upper()
-                        
-                        # Format resolution (e.g., 3840x2160 -> 4K)
-                        res_str = f"{width}x{height}"
-                        if width and width >= 3800: res_str = "4K"
-                        elif width and width >= 1900: res_str = "1080p"
-                        elif width and width >= 1200: res_str = "720p"
-                        
-                        # Format duration
-                        run_ticks = updated_item.get('RunTimeTicks', 0)
-                        duration_str = ""
-                        if run_ticks:
-                            total_seconds = run_ticks / 10000000
-                            hours = int(total_seconds // 3600)
-                            minutes = int((total_seconds % 3600) // 60)
-                            if hours > 0: duration_str = f" | {hours}h {minutes}m"
-                            else: duration_str = f" | {minutes}m"
-                        
-                        logger.info(f"[成功] {name} 获取到信息: {res_str} {codec}{duration_str}")
-                        self.stats["success"] += 1
-                        self.db.set_media_status(item_id, name, item.get("Path", ""), "success", f"{res_str} {codec}{duration_str}")
-                            
-                        await manager.broadcast(f"[{index + 1}/{total_strm_todo}] 成功: {name} ({res_str} {codec}{duration_str})")
-                    else:
-                        await manager.broadcast(f"[{index + 1}/{total_strm_todo}] 失败: {name} - Emby 无法读取文件头 (可能是坏链或网盘超时)")
-                        self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True)
-                        
-                except httpx.HTTPStatusError as e:
-                    if e.response.status_code in [403, 429]:
-                        await manager.broadcast(f"错误: {e.response.status_code} - 可能触发风控，任务自动停止！")
-                        if e.response.status_code == 403:
-                             await manager.broadcast(f"<pre class='text-xs bg-gray-800 p-2 rounded mt-1'>{e.response.text}</pre>")
-                        logger.error(f"Rate limit or Forbidden hit: {e}")
+            await job.log("准备开始修复任务...")
+            try:
+                # Items a previous run queued but never finished go first,
+                # read back from the checkpoint a page at a time
+                proceed = True
+                after = None
+                while resumed:
+                    chunk = await self.db.get_pending(library_id, after, 100)
+                    if not chunk:
                         break
-                    else:
-                        await manager.broadcast(f"[{index + 1}/{total_strm_todo}] 失败: {name} (HTTP {e.response.status_code})")
-                        self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True)
-                except Exception as e:
-                    await manager.broadcast(f"[{index + 1}/{total_strm_todo}] 异常: {name} ({str(e)})")
-                    self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True)
-                finally:
-                    self.stats["processed"] += 1
-                    processed_local += 1
-
-                # Sleep logic with interruption check
-                sleep_time = config.scan_interval
-                for _ in range(sleep_time):
-                    if self.should_stop:
+                    after = chunk[-1]
+                    candidates = await select_candidates(
+                        await client.get_items_by_ids(chunk, item_fields, priority.user_data)
+                    )
+                    keep = {item["Id"] for item, _ in candidates}
+                    await self.db.remove_pending(library_id, [item_id for item_id in chunk if item_id not in keep])
+                    if not await dispatch_all(candidates, start_index, requeue=True):
+                        proceed = False
                         break
-                    await asyncio.sleep(1)
-                
-                if self.should_stop:
-                    await manager.broadcast("[系统] 用户已手动终止任务")
-                    break
-            
-            if not self.should_stop:
-                await manager.broadcast("任务完成！")
-                processed_all = (not limited) and (processed_local == pending_total)
-                if processed_all:
-                    if full_mode:
-                        db_ids = set(self.db.get_all_ids())
-                        missing = list(db_ids - scanned_ids)
-                        removed = self.db.delete_ids(missing)
-                        await manager.broadcast(f"[清理] 发现 {removed} 个已删除项目，已从数据库移除")
-                    self.db.set_config("last_sync_time", datetime.datetime.utcnow().isoformat() + "Z")
+
+                if job.events_only:
+                    exhausted = True
+                elif proceed and not (job.should_stop or job.rate_limited):
+                    pages = client.get_items(
+                        library_id,
+                        since,
+                        page_size=max(config.scan_page_size, 1),
+                        concurrency=config.scan_page_concurrency,
+                        lean=config.lean_scan,
+                        start_index=start_index,
+                        extra_fields=item_fields,
+                        user_data=priority.user_data,
+                    )
+                    exhausted = True
+                    async for batch in pages:
+                        loaded_count += len(batch)
+                        ITEMS_SCANNED.inc(len(batch), library=library_id)
+                        job.stats["scanned"] = start_index + loaded_count
+                        if loaded_count - last_reported >= 1000:
+                            await job.log(f"[扫描] 已加载 {loaded_count} 个项目...")
+                            last_reported = loaded_count
+                        if full_mode:
+                            await self.db.add_seen_ids(library_id, [item["Id"] for item in batch if item.get("Id")])
+                        candidates = await select_candidates(batch)
+                        # The whole page is queued in the checkpoint at once,
+                        # so stopping mid-page loses nothing.
+                        if (
+                            not await dispatch_all(candidates, start_index + loaded_count)
+                            or job.should_stop or job.rate_limited
+                        ):
+                            exhausted = False
+                            break
+                    # A full scan already saw every due item; an incremental
+                    # one only sees changed items, so fetch the due ones here.
+                    if exhausted and not full_mode:
+                        exhausted = await retry_pass()
+
+                # Keep taking notifications while the probe queues still have
+                # work; items notified after that go to a follow-up run.
+                while not (job.should_stop or job.rate_limited) and any(q.qsize() for q in queues.values()):
+                    await asyncio.sleep(0.5)
+                feeding_done = True
+                job.wakeup.set()
+                await feeder_task
+                pending_total = job.stats["total"]
+                scan_complete = exhausted and not (job.should_stop or job.rate_limited)
+                if job.events_only:
+                    await job.log(f"[Webhook] 待修复队列: {pending_total} 个文件。")
+                elif scan_complete:
+                    await job.log(f"扫描完成: 共发现 {start_index + loaded_count} 个项目。")
+                    await job.log(f"智能过滤: {skipped_count} 个 .strm 文件已有媒体信息或被黑名单忽略。")
+                    if precheck is not None:
+                        await job.log(f"[预检] 本地预检发现 {dead_count} 个失效链接，已直接标记失败。")
+                    if path_rules.hits:
+                        await job.log(f"[规则] 路径规则命中: {path_rules.summary()}")
+                    await job.log(f"待修复队列: {pending_total} 个文件。")
+                elif limit_reached:
+                    await job.log(f"配置限制: 达到批量上限，仅处理前 {pending_total} 个文件。")
+                # Workers drain their queue and exit; when stopping, whatever
+                # is left stays in the checkpoint, and workers still waiting
+                # for a token or slot are cancelled rather than waited for.
+                for queue in queues.values():
+                    if job.should_stop or job.rate_limited:
+                        queue.close()
+                    else:
+                        queue.finish()
+                if job.should_stop or job.rate_limited:
+                    for worker in workers:
+                        worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                # Let verifications of already-probed items finish, unless stopping
+                if not job.should_stop and job.verify_tasks:
+                    await asyncio.gather(*job.verify_tasks)
+            finally:
+                feeder_task.cancel()
+                await verifier.close()
+                if precheck is not None:
+                    await precheck.close()
+                await status_writer.flush()
+                for worker in workers:
+                    worker.cancel()
+
+            if job.events_only:
+                if not job.should_stop:
+                    await job.log("[Webhook] 新项目处理完成。")
+                return
+
+            completed = scan_complete and not job.should_stop and not await self.db.count_pending(library_id)
+            if not completed:
+                # Keep the checkpoint; a paused run is resumed by the next start
+                await self.db.set_checkpoint_state(library_id, job.held_state)
+
+            if pending_total == 0 and completed:
+                await job.log("所有 .strm 文件均正常或已忽略，任务结束。")
+                await self._finish_run(job, full_mode, run_started)
+                return
+
+            if job.resume_on_start:
+                await job.log("[系统] 服务关闭，任务已中断，进度已保存，重启后自动继续")
+            elif job.should_stop:
+                await job.log("[系统] 用户已手动终止任务，进度已保存")
+
+            if not job.should_stop:
+                await job.log("任务完成！")
+                if completed:
+                    await self._finish_run(job, full_mode, run_started)
                 else:
-                    await manager.broadcast("[提示] 本次未完成全部待修复队列，未更新增量时间戳")
+                    await job.log("[提示] 本次未完成全部待修复队列，进度已保存，下次启动将从断点继续")
 
+        except asyncio.CancelledError:
+            # Stop gave up waiting for the run; keep its checkpoint
+            if not job.events_only:
+                await self.db.set_checkpoint_state(library_id, job.held_state)
+            raise
         except Exception as e:
-            await manager.broadcast(f"系统错误: {str(e)}")
+            job.state = "failed"
+            await job.log(f"系统错误: {str(e)}")
             logger.error(traceback.format_exc())
+            if not job.events_only:
+                try:
+                    await self.db.set_checkpoint_state(library_id, "paused")
+                except Exception:
+                    pass
+
+    def _queue_depths(self) -> Dict:
+        depths: Dict = {}
+        for job in self.running_jobs:
+            for backend, queue in job.queues.items():
+                key = (backend.name,)
+                depths[key] = depths.get(key, 0) + queue.qsize()
+        return depths
+
+    async def _finish_run(self, job: Job, full_mode: bool, watermark: str):
+        if full_mode:
+            removed = await self.db.delete_unseen_ids(job.library_id)
+            await job.log(f"[清理] 发现 {removed} 个已删除项目，已从数据库移除")
+        await self.db.finish_checkpoint(job.library_id, watermark)
+
+    async def _item_done(self, job: Job, item_id: str):
+        job.stats["processed"] += 1
+        await self.db.remove_pending(job.library_id, [item_id])
+
+    async def resume_interrupted(self):
+        """Re-queue runs that a restart cut short (stopped runs wait for the user)."""
+        checkpoints = await self.db.get_checkpoints("running")
+        if checkpoints:
+            logger.info(f"恢复 {len(checkpoints)} 个中断的任务")
+            await self.enqueue([checkpoint["library_id"] for checkpoint in checkpoints])
+
+    async def _load_learned_rates(self) -> Dict[str, float]:
+        raw = await self.db.get_config("learned_rates")
+        if not raw:
+            return {}
+        try:
+            return {k: float(v) for k, v in json.loads(raw).items()}
+        except (ValueError, TypeError, AttributeError):
+            return {}
+
+    async def _save_learned_rates(self, backends):
+        rates = await self._load_learned_rates()
+        for backend in backends:
+            rates[backend.name] = backend.rate
+        await self.db.set_config("learned_rates", json.dumps(rates))
+
+    async def _probe_worker(
+        self,
+        job: Job,
+        client,
+        backend,
+        queue: ProbeQueue,
+        verifier: BatchVerifier,
+    ):
+        while not (job.should_stop or job.rate_limited):
+            item = await queue.get()
+            if item is None:
+                return
+            rule = job.path_rules.check(item.get("Path", "")) if job.path_rules else None
+            if rule is not None:
+                # Excluded by a rule added while it waited in the queue
+                ITEMS_IGNORED.inc(library=job.library_id, reason="path_rule")
+                await self.db.set_media_status(
+                    item["Id"], item.get("Name"), item.get("Path", ""), "ignored", library_id=job.library_id
+                )
+                await self._item_done(job, item["Id"])
+                continue
+            index = job.dequeued
+            job.dequeued += 1
+            retry = True
+            # A throttled item is retried by the same worker once the backend
+            # pause is over, so it is not lost when the queue finishes.
+            while retry:
+                async with backend.turn(self.probe_slots, job.library_id, job.weight):
+                    if job.should_stop or job.rate_limited:
+                        return
+                    retry = await self._probe_item(job, client, backend, item, index, verifier)
+
+    async def _probe_item(
+        self,
+        job: "Job",
+        client,
+        backend,
+        item,
+        index: int,
+        verifier: BatchVerifier,
+    ) -> bool:
+        """Probe one item. Returns True when it was throttled and should be retried."""
+        total_strm_todo = job.stats["total"]
+        name = item.get('Name', 'Unknown')
+        item_id = item.get('Id')
+        logger.info(f"[探测] 正在处理: {name} (ID: {item_id})...")
+
+        await job.log(f"[{index + 1}/{total_strm_todo}] 正在探测: {name}...")
+
+        deadline = self._shared_config.probe_timeout
+        try:
+            # 1. Low Bitrate Trick (Force Probe)
+            started = time.monotonic()
+            ITEMS_PROBED.inc(backend=backend.name)
+            PROBES_IN_FLIGHT.inc(backend=backend.name)
+            try:
+                finished = await self._await_probe(job, client.refresh_item(item_id, timeout=deadline or None), deadline)
+            finally:
+                PROBES_IN_FLIGHT.dec(backend=backend.name)
+                REFRESH_LATENCY.observe(time.monotonic() - started, backend=backend.name)
+            if not finished:
+                # Abandoned by Stop: it stays in the checkpoint for the next run
+                return False
+            backend.record_success(time.monotonic() - started)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            await job.log(f"[{index + 1}/{total_strm_todo}] 超时: {name} (超过 {deadline:g}s 未响应，稍后重试)")
+            await self.db.set_media_status(item_id, name, item.get("Path", ""), "timeout", library_id=job.library_id)
+            PROBE_TIMEOUTS.inc(backend=backend.name)
+            backend.record_timeout()
+            await self._item_done(job, item_id)
+            return False
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in [403, 429]:
+                RATE_LIMIT_HITS.inc(backend=backend.name, status=str(e.response.status_code))
+                backoff = backend.record_penalty(parse_retry_after(e.response.headers.get("Retry-After")))
+                logger.warning(f"Rate limit or Forbidden hit on {backend.name}: {e}")
+                # Read per hit, so a config change reaches running jobs too
+                max_penalties = self._shared_config.max_consecutive_penalties
+                if backend.consecutive_penalties < max_penalties:
+                    await job.log(
+                        f"[限速] {e.response.status_code} - 后端 {backend.name} 退避 {backoff:.0f}s，"
+                        f"间隔调整为 {1 / backend.rate:.2f}s ({backend.consecutive_penalties}/{max_penalties})"
+                    )
+                    return True
+                # Stop every worker, not just this one
+                job.rate_limited = True
+                await job.log(f"错误: {e.response.status_code} - 连续 {max_penalties} 次触发风控，任务自动停止！")
+                if e.response.status_code == 403:
+                     await job.log(f"<pre class='text-xs bg-gray-800 p-2 rounded mt-1'>{e.response.text}</pre>")
+                logger.error(f"Rate limit or Forbidden hit: {e}")
+                # Not probed: it stays in the checkpoint for the next run
+                job.stats["processed"] += 1
+                return False
+            await job.log(f"[{index + 1}/{total_strm_todo}] 失败: {name} (HTTP {e.response.status_code})")
+            await self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True, job.library_id)
+            ITEMS_FAILED.inc(backend=backend.name)
+            await self._item_done(job, item_id)
+            return False
+        except Exception as e:
+            await job.log(f"[{index + 1}/{total_strm_todo}] 异常: {name} ({str(e)})")
+            await self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True, job.library_id)
+            ITEMS_FAILED.inc(backend=backend.name)
+            await self._item_done(job, item_id)
+            return False
+
+        # 2. Post-Check Verification runs in the background, batched with other
+        # recently probed items, so this worker can move on to the next probe.
+        task = asyncio.create_task(self._verify_item(job, verifier, item, index, backend.name))
+        job.verify_tasks.add(task)
+        task.add_done_callback(job.verify_tasks.discard)
+        return False
+
+    @staticmethod
+    async def _await_probe(job: Job, request, deadline: float) -> bool:
+        """
+        Run one probe request within its deadline budget. Returns False when
+        Stop cancelled it and raises asyncio.TimeoutError once the deadline
+        has passed; either way the request itself is abandoned.
+        """
+        probe = asyncio.ensure_future(request)
+        job.probes.add(probe)
+        try:
+            done, _ = await asyncio.wait({probe}, timeout=deadline if deadline > 0 else None)
         finally:
-            self.is_running = False
-            self.current_task = None
+            job.probes.discard(probe)
+            probe.cancel()
+        if not done:
+            raise asyncio.TimeoutError()
+        if probe.cancelled():
+            return False
+        probe.result()
+        return True
+
+    async def _verify_item(self, job: "Job", verifier: BatchVerifier, item, index: int, backend_name: str):
+        total_strm_todo = job.stats["total"]
+        name = item.get('Name', 'Unknown')
+        item_id = item.get('Id')
+        started = time.monotonic()
+        succeeded = False
+        try:
+            updated_item = await verifier.verify(item_id)
+            media_streams = updated_item.get('MediaStreams', [])
+
+            if media_streams and len(media_streams) > 0:
+                # Extract rich info for logging
+                video_stream = next((s for s in media_streams if s.get('Type') == 'Video'), {})
+                width = video_stream.get('Width')
+                height = video_stream.get('Height')
+                codec = video_stream.get('Codec', 'Unknown').upper()
+
+                # Format resolution (e.g., 3840x2160 -> 4K)
+                res_str = f"{width}x{height}"
+                if width and width >= 3800: res_str = "4K"
+                elif width and width >= 1900: res_str = "1080p"
+                elif width and width >= 1200: res_str = "720p"
+
+                # Format duration
+                run_ticks = updated_item.get('RunTimeTicks', 0)
+                duration_str = ""
+                if run_ticks:
+                    total_seconds = run_ticks / 10000000
+                    hours = int(total_seconds // 3600)
+                    minutes = int((total_seconds % 3600) // 60)
+                    if hours > 0: duration_str = f" | {hours}h {minutes}m"
+                    else: duration_str = f" | {minutes}m"
+
+                logger.info(f"[成功] {name} 获取到信息: {res_str} {codec}{duration_str}")
+                job.stats["success"] += 1
+                succeeded = True
+                await self.db.set_media_status(
+                    item_id, name, item.get("Path", ""), "success", f"{res_str} {codec}{duration_str}", library_id=job.library_id
+                )
+
+                await job.log(f"[{index + 1}/{total_strm_todo}] 成功: {name} ({res_str} {codec}{duration_str})")
+            else:
+                await job.log(f"[{index + 1}/{total_strm_todo}] 失败: {name} - Emby 无法读取文件头 (可能是坏链或网盘超时)")
+                await self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True, job.library_id)
+        except httpx.HTTPStatusError as e:
+            await job.log(f"[{index + 1}/{total_strm_todo}] 失败: {name} (HTTP {e.response.status_code})")
+            await self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True, job.library_id)
+        except Exception as e:
+            await job.log(f"[{index + 1}/{total_strm_todo}] 异常: {name} ({str(e)})")
+            await self.db.set_media_status(item_id, name, item.get("Path", ""), "failed", None, True, job.library_id)
+        VERIFY_LATENCY.observe(time.monotonic() - started, backend=backend_name)
+        (ITEMS_SUCCEEDED if succeeded else ITEMS_FAILED).inc(backend=backend_name)
+        await self._item_done(job, item_id)
 
 task_manager = TaskManager()
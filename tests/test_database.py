@@ -0,0 +1,38 @@
+import asyncio
+import os
+import time
+
+from database import RETRY_BASE_DELAY, RETRY_JITTER, AsyncDatabase, Database
+
+
+def test_success_resets_retry_count(tmp_path):
+    db = Database(str(tmp_path / "emby_doctor.db"))
+    db.set_media_status("1", "Item", "/mnt/a/1.strm", "failed", None, True, "lib1")
+    db.set_media_status("1", "Item", "/mnt/a/1.strm", "failed", None, True, "lib1")
+    db.set_media_status("1", "Item", "/mnt/a/1.strm", "success", "1080p H264", library_id="lib1")
+    row = db.get_media_statuses(["1"])["1"]
+    assert row["retry_count"] == 0
+    assert row["next_retry_at"] is None
+
+    # Failing again starts over: one failure, with the first backoff step
+    db.set_media_status("1", "Item", "/mnt/a/1.strm", "failed", None, True, "lib1")
+    row = db.get_media_statuses(["1"])["1"]
+    assert row["retry_count"] == 1
+    delay = row["next_retry_at"] - time.time()
+    assert RETRY_BASE_DELAY * (1 - RETRY_JITTER) - 5 <= delay <= RETRY_BASE_DELAY * (1 + RETRY_JITTER) + 5
+    db.close()
+
+
+def test_async_close_checkpoints_the_wal(tmp_path):
+    path = str(tmp_path / "emby_doctor.db")
+
+    async def scenario():
+        db = AsyncDatabase(path)
+        await db.set_media_status("1", "Item", "/mnt/a/1.strm", "failed", None, True, "lib1")
+        assert (await db.get_media_statuses(["1"]))["1"]["retry_count"] == 1
+        await db.get_stats()
+        db.close()
+
+    asyncio.run(scenario())
+    # Every connection is closed, so the WAL was folded into the database
+    assert not os.path.exists(path + "-wal")
@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+from rate_limiter import Backend, WeightedSlots
+
+
+def test_backend_interval_holds_with_two_jobs_on_a_shared_budget():
+    async def scenario():
+        shared = WeightedSlots(4)
+        limited = Backend("/mnt/115/", 0.2, 2)
+        default = Backend("", 0.001, 4)
+        starts = []
+
+        async def worker(backend, job, probes, duration, record):
+            for _ in range(probes):
+                async with backend.turn(shared, job):
+                    if record:
+                        starts.append(time.monotonic())
+                    await asyncio.sleep(duration)
+
+        # Slow default-backend probes of both jobs keep the shared budget full
+        await asyncio.gather(
+            *[worker(limited, job, 3, 0.01, True) for job in ("lib1", "lib2")],
+            *[worker(default, job, 8, 0.15, False) for job in ("lib1", "lib2") for _ in range(2)],
+        )
+        return starts
+
+    starts = asyncio.run(scenario())
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert len(starts) == 6
+    assert min(gaps) >= 0.2 * 0.95
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from metrics import VERIFY_QUERY_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("future", "deadline", "next_check", "delay")
+
+    def __init__(self, future: asyncio.Future, deadline: float, next_check: float, delay: float):
+        self.future = future
+        self.deadline = deadline
+        self.next_check = next_check
+        self.delay = delay
+
+
+class BatchVerifier:
+    """
+    Verifies probed items in batches. Each `verify()` call registers an item;
+    a background loop checks every due item with one multi-Ids query, polling
+    with exponential backoff until MediaStreams appear or the timeout passes.
+    Items that become due within `batch_window` of each other share a query.
+    """
+
+    def __init__(
+        self,
+        client,
+        initial_delay: float = 1.0,
+        max_delay: float = 8.0,
+        timeout: float = 30.0,
+        max_batch: int = 100,
+        batch_window: float = 0.5,
+    ):
+        self.client = client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.pending: Dict[str, _Pending] = {}
+        self.queries = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def verify(self, item_id: str) -> Dict:
+        """
+        Wait until Emby reports MediaStreams for the item and return it. At the
+        timeout the last seen item (or {}) is returned; if every query failed
+        the last error is raised instead.
+        """
+        loop = asyncio.get_running_loop()
+        entry = self.pending.get(item_id)
+        if entry is None:
+            now = loop.time()
+            entry = _Pending(
+                loop.create_future(),
+                deadline=now + self.timeout,
+                next_check=now + self.initial_delay,
+                delay=self.initial_delay,
+            )
+            self.pending[item_id] = entry
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+            self._wakeup.set()
+        return await entry.future
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for entry in self.pending.values():
+            if not entry.future.done():
+                entry.future.cancel()
+        self.pending.clear()
+
+    def _due_ids(self, now: float) -> List[str]:
+        due = [
+            (entry.next_check, item_id)
+            for item_id, entry in self.pending.items()
+            if entry.next_check <= now + self.batch_window
+        ]
+        due.sort()
+        return [item_id for _, item_id in due[: self.max_batch]]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            now = loop.time()
+            due = self._due_ids(now)
+            if not due:
+                wait = min(entry.next_check for entry in self.pending.values()) - now
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            error = None
+            found = {}
+            try:
+                self.queries += 1
+                started = time.monotonic()
+                try:
+                    for item in await self.client.get_items_by_ids(due):
+                        found[item.get("Id")] = item
+                finally:
+                    VERIFY_QUERY_LATENCY.observe(time.monotonic() - started)
+            except Exception as e:
+                logger.warning(f"批量校验请求失败: {e}")
+                error = e
+
+            now = loop.time()
+            for item_id in due:
+                entry = self.pending.get(item_id)
+                if entry is None:
+                    continue
+                item = found.get(item_id)
+                if entry.future.done():
+                    del self.pending[item_id]
+                elif item and item.get("MediaStreams"):
+                    entry.future.set_result(item)
+                    del self.pending[item_id]
+                elif now >= entry.deadline:
+                    if error is not None and item is None:
+                        entry.future.set_exception(error)
+                    else:
+                        entry.future.set_result(item or {})
+                    del self.pending[item_id]
+                else:
+                    entry.delay = min(entry.delay * 2, self.max_delay)
+                    entry.next_check = min(now + entry.delay, entry.deadline)
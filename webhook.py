@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Notifications that announce new media: Emby's "library.new", and the
+# "ItemAdded" NotificationType of the Jellyfin webhook plugin templates.
+NEW_ITEM_EVENTS = {"library.new", "item.added", "itemadded"}
+
+
+async def read_payload(request) -> Dict:
+    """
+    Notification body as a dict: JSON, or the `data` field of the form
+    post that older Emby webhook plugins send.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        form = await request.form()
+        raw = form.get("data") or "{}"
+    else:
+        raw = await request.body()
+    try:
+        payload = json.loads(raw or b"{}")
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def parse_notification(payload: Dict) -> List[str]:
+    """
+    Item ids a notification asks us to look at. Besides Emby/Jellyfin
+    notifications, `{"ItemIds": [...]}` is accepted from any change feed.
+    Items whose path is known and is not a .strm are dropped right away.
+    """
+    ids = payload.get("ItemIds")
+    if isinstance(ids, list):
+        return [str(item_id) for item_id in ids if item_id]
+    event = str(payload.get("Event") or payload.get("NotificationType") or "").lower()
+    if event not in NEW_ITEM_EVENTS:
+        return []
+    item = payload.get("Item") or {}
+    item_id = item.get("Id") or payload.get("ItemId")
+    path = item.get("Path") or ""
+    if not item_id or (path and not path.lower().endswith(".strm")):
+        return []
+    return [str(item_id)]
+
+
+class WebhookIntake:
+    """
+    Debounces item ids arriving from webhook calls.
+
+    Ids are collected, deduplicated, until none has arrived for `debounce`
+    seconds (or `max_delay` after the first one, whichever comes first),
+    then handed to `handler` in one call. A burst of notifications for a
+    newly added season thus turns into one batched lookup.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[str]], Awaitable[None]],
+        debounce: float = 5.0,
+        max_delay: float = 30.0,
+    ):
+        self.handler = handler
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._ids: Dict[str, None] = {}  # insertion-ordered set
+        self._first = 0.0
+        self._last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, item_ids: List[str]) -> int:
+        """Queue ids for the next batch; returns how many were not queued yet."""
+        added = 0
+        for item_id in item_ids:
+            if item_id not in self._ids:
+                self._ids[item_id] = None
+                added += 1
+        if added:
+            self._last = time.monotonic()
+            if self._task is None:
+                self._first = self._last
+                self._task = asyncio.create_task(self._flush_later())
+        return added
+
+    async def _flush_later(self):
+        try:
+            while True:
+                due = min(self._last + self.debounce, self._first + self.max_delay)
+                delay = due - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            item_ids = list(self._ids)
+            self._ids.clear()
+        finally:
+            # Ids arriving from here on start the next batch
+            self._task = None
+        try:
+            await self.handler(item_ids)
+        except Exception as e:
+            logger.error(f"处理 Webhook 项目失败: {e}")